@@ -0,0 +1,33 @@
+from django.core.cache.backends import locmem
+
+from . import sqlite_cache
+from .instrumentation import muted, record_cache
+
+_MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    """Отмечает попадания и промахи кэша в статистике запроса."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            record_cache(0, 1)
+            return default
+        record_cache(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        with muted():
+            values = super().get_many(keys, version)
+        record_cache(len(values), len(keys) - len(values))
+        return values
+
+
+class LocMemCache(InstrumentedCacheMixin, locmem.LocMemCache):
+    pass
+
+
+class SQLiteCache(InstrumentedCacheMixin, sqlite_cache.SQLiteCache):
+    pass
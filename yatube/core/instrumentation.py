@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+_local = threading.local()
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class QueryBudgetExceeded(Exception):
+    """Представление сделало больше запросов, чем ему разрешено."""
+
+
+class RequestStats:
+    """Сколько запросов, времени в БД и обращений к кэшу стоил запрос."""
+
+    def __init__(self):
+        self.queries = 0
+        self.writes = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.statements = Counter()
+        self.muted = False
+
+    @property
+    def duplicates(self):
+        return sum(n - 1 for n in self.statements.values() if n > 1)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            if sql.lstrip()[:6].upper() in WRITES:
+                self.writes += 1
+            self.statements[(sql, repr(params))] += 1
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'writes': self.writes,
+            'db_ms': round(self.db_time * 1000, 2),
+            'duplicates': self.duplicates,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+def current():
+    return getattr(_local, 'stats', None)
+
+
+@contextmanager
+def collect():
+    """Считает запросы ко всем БД и обращения к кэшу в этом потоке."""
+    stats = RequestStats()
+    previous, _local.stats = current(), stats
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            yield stats
+    finally:
+        _local.stats = previous
+
+
+def record_cache(hits, misses):
+    stats = current()
+    if stats is not None and not stats.muted:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+@contextmanager
+def muted():
+    """Не считать вложенные обращения (get_many поверх get)."""
+    stats = current()
+    if stats is None or stats.muted:
+        yield
+        return
+    stats.muted = True
+    try:
+        yield
+    finally:
+        stats.muted = False
@@ -0,0 +1,138 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils._os import safe_join
+from django.utils.http import http_date, quote_etag
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def resolve(relative):
+    """Путь файла внутри MEDIA_ROOT или None, если отдавать нечего."""
+    try:
+        path = safe_join(settings.MEDIA_ROOT, relative)
+    except SuspiciousFileOperation:
+        return None
+    private = tuple(os.path.join(directory, '')
+                    for directory in settings.MEDIA_PRIVATE_DIRS)
+    if path.startswith(private) or not os.path.isfile(path):
+        return None
+    return path
+
+
+def etag_for(stat):
+    """Сильный ETag из времени изменения и размера, как у nginx."""
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+def byte_range(header, size):
+    """
+    (начало, конец) из заголовка Range или None, если его нужно
+    проигнорировать. Несколько диапазонов не поддерживаются - тогда
+    отдаётся весь файл, это разрешено RFC 7233. Для диапазона за
+    концом файла возвращается ValueError.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(path, start, end):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def accel_response(path, relative):
+    """Ответ без тела: файл отдаст фронт-сервер (nginx или Apache)."""
+    response = HttpResponse()
+    if settings.MEDIA_ACCEL == 'x-accel':
+        response['X-Accel-Redirect'] = (settings.MEDIA_ACCEL_PREFIX
+                                        + quote(relative))
+    else:
+        response['X-Sendfile'] = path
+    # Тип определит фронт-сервер по своей таблице.
+    del response['Content-Type']
+    return response
+
+
+def is_immutable(relative):
+    return relative.startswith(tuple(settings.MEDIA_IMMUTABLE_PREFIXES))
+
+
+def file_response(request, path, size, etag):
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if header and (not if_range or if_range == etag):
+        try:
+            bounds = byte_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if bounds is not None:
+            start, end = bounds
+            response = StreamingHttpResponse(
+                read_range(path, start, end), status=206,
+                content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+            response['Accept-Ranges'] = 'bytes'
+            return response
+    response = FileResponse(open(path, 'rb'), content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def serve(request, path, relative):
+    """
+    Отдаёт файл path: через фронт-сервер, если он настроен,
+    иначе FileResponse (wsgi.file_wrapper - sendfile без копирования).
+    Поддерживает If-None-Match/If-Modified-Since и один диапазон Range.
+    """
+    stat = os.stat(path)
+    etag = etag_for(stat)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        if settings.MEDIA_ACCEL:
+            response = accel_response(path, relative)
+        else:
+            response = file_response(request, path, stat.st_size, etag)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if is_immutable(relative):
+        patch_cache_control(response, public=True, immutable=True,
+                            max_age=settings.MEDIA_IMMUTABLE_MAX_AGE)
+    else:
+        patch_cache_control(response, public=True,
+                            max_age=settings.MEDIA_MAX_AGE)
+    return response
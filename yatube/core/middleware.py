@@ -0,0 +1,47 @@
+import json
+import logging
+
+from django.conf import settings
+
+from .instrumentation import QueryBudgetExceeded, collect
+
+logger = logging.getLogger(__name__)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Считает запросы к БД, их время, дубли и обращения к кэшу за запрос.
+
+    Итог уходит в заголовок Server-Timing и в лог одной JSON-строкой.
+    Для имени URL из QUERY_BUDGETS проверяется бюджет запросов:
+    превышение пишется в лог, а при QUERY_BUDGET_RAISE - падает.
+    Бюджет задан для тёплого пути чтения, поэтому запрос, который сам
+    что-то записал (первая генерация миниатюр, сессия), только логируется.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with collect() as stats:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+        report = {'method': request.method, 'path': request.path,
+                  'view': view_name, 'status': response.status_code,
+                  **stats.as_dict()}
+        response['Server-Timing'] = (
+            f'db;dur={report["db_ms"]};desc="{stats.queries} queries, '
+            f'{stats.duplicates} duplicate", '
+            f'cache;desc="{stats.cache_hits} hit, '
+            f'{stats.cache_misses} miss"'
+        )
+        logger.info(json.dumps(report, ensure_ascii=False))
+        budget = settings.QUERY_BUDGETS.get(view_name)
+        if budget is not None and stats.queries > budget:
+            message = (f'{view_name}: {stats.queries} запросов '
+                       f'при бюджете {budget}')
+            logger.warning(message)
+            if settings.QUERY_BUDGET_RAISE and not stats.writes:
+                raise QueryBudgetExceeded(message)
+        return response
@@ -0,0 +1,206 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+# Ограничение SQLite на число параметров в запросе (старые сборки).
+CHUNK_SIZE = 500
+
+
+class SQLiteCache(BaseCache):
+    """
+    Кэш в файле SQLite (LOCATION), общий для всех процессов хоста.
+
+    Журнал WAL: читатели не ждут писателя и друг друга. Каждая
+    операция - один запрос, а incr идёт в транзакции BEGIN IMMEDIATE,
+    то есть под блокировкой записи всего файла, и атомарен между
+    процессами. Целые числа хранятся как есть, остальное - pickle.
+    Соединение своё у каждого потока и процесса (после fork - новое).
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._cull_every = options.get('CULL_EVERY', 100)
+        self._local = threading.local()
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=self._busy_timeout,
+                isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for sql in SCHEMA:
+                connection.execute(sql)
+            local.connection, local.pid, local.writes = (
+                connection, os.getpid(), 0)
+        return local.connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    @staticmethod
+    def _encode(value):
+        # bool - тоже int, но вернуться должен bool; большие - в pickle.
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decode(value):
+        return value if isinstance(value, int) else pickle.loads(value)
+
+    def get(self, key, default=None, version=None):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._key(key, version), time.time())).fetchone()
+        return default if row is None else self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        lookup = {self._key(key, version): key for key in keys}
+        found = {}
+        now = time.time()
+        names = list(lookup)
+        for start in range(0, len(names), CHUNK_SIZE):
+            chunk = names[start:start + CHUNK_SIZE]
+            rows = self._connection().execute(
+                f'SELECT key, value FROM cache '
+                f'WHERE key IN ({", ".join("?" * len(chunk))}) '
+                f'AND (expires IS NULL OR expires > ?)', (*chunk, now))
+            for name, value in rows:
+                found[lookup[name]] = self._decode(value)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [(self._key(key, version), self._encode(value), expires)
+                for key, value in data.items()]
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)', rows)
+        self._maybe_cull(len(rows))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Одна инструкция: вставка или замена только просроченной записи.
+        cursor = self._connection().execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            'expires = excluded.expires WHERE cache.expires <= ?',
+            (self._key(key, version), self._encode(value),
+             self.get_backend_timeout(timeout), time.time()))
+        added = cursor.rowcount == 1
+        if added:
+            self._maybe_cull(1)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), self._key(key, version),
+             time.time()))
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._transaction() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time())).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._decode(row[0]) + delta
+            connection.execute('UPDATE cache SET value = ? WHERE key = ?',
+                               (self._encode(value), key))
+        return value
+
+    def incr_many(self, keys, delta=1, version=None):
+        """
+        Сдвигает целые значения ключей на delta одной транзакцией.
+
+        В отличие от incr, отсутствующие ключи молча пропускаются.
+        """
+        rows = [(delta, self._key(key, version), time.time())
+                for key in keys]
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE cache SET value = value + ? WHERE key = ? "
+                "AND typeof(value) = 'integer' "
+                "AND (expires IS NULL OR expires > ?)", rows)
+
+    def has_key(self, key, version=None):
+        return self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._key(key, version), time.time())).fetchone() is not None
+
+    def delete(self, key, version=None):
+        cursor = self._connection().execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),))
+        return cursor.rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        names = [self._key(key, version) for key in keys]
+        with self._transaction() as connection:
+            connection.executemany('DELETE FROM cache WHERE key = ?',
+                                   [(name,) for name in names])
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def _maybe_cull(self, writes):
+        # Чистка раз в CULL_EVERY записей процесса, а не на каждой.
+        local = self._local
+        local.writes += writes
+        if local.writes < self._cull_every:
+            return
+        local.writes = 0
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM cache WHERE expires <= ?',
+                               (time.time(),))
+            count, = connection.execute(
+                'SELECT COUNT(*) FROM cache').fetchone()
+            if count > self._max_entries:
+                # Как и LocMemCache: убираем 1/cull_frequency записей,
+                # первыми - те, что скоро истекут.
+                connection.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                    'ORDER BY expires IS NULL, expires LIMIT ?)',
+                    (max(count // self._cull_frequency, 1),))
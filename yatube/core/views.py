@@ -1,4 +1,8 @@
+from django.http import Http404
 from django.shortcuts import render
+from django.views.decorators.http import require_safe
+
+from . import media
 
 
 def page_not_found(request, exception):
@@ -15,3 +19,12 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@require_safe
+def serve_media(request, path):
+    """Файлы MEDIA_ROOT: с ETag, Range и передачей фронт-серверу."""
+    full_path = media.resolve(path)
+    if full_path is None:
+        raise Http404
+    return media.serve(request, full_path, path)
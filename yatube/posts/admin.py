@@ -1,9 +1,82 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
 
+from .forms import AdminPostForm
 from .models import Follow, Group, Post, Comment
+from .services import counts, search, tags
 
 
-class PostAdmin(admin.ModelAdmin):
+class EstimatedCountPaginator(Paginator):
+    """
+    Для нефильтрованного списка берёт оценку числа строк из статистики
+    СУБД (после ANALYZE) вместо COUNT(*) по всей таблице.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = counts.estimate_rows(queryset.model)
+            if (estimate is not None
+                    and estimate >= settings.ADMIN_COUNT_ESTIMATE_MIN):
+                return estimate
+        return super().count
+
+
+class PerformanceAdminMixin:
+    """
+    Режим производительности для больших списков в админке.
+
+    Связанные объекты грузятся JOIN-ом (list_select_related), варианты
+    выбора для list_editable читаются один раз на запрос, число строк
+    оценивается, а правки списка сохраняются одним bulk_update.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    bulk_edit = True
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        # Поля raw_id и autocomplete не держат список вариантов.
+        if (field is not None and db_field.name in self.list_editable
+                and db_field.name not in self.raw_id_fields
+                and db_field.name not in self.autocomplete_fields):
+            # Форма строки списка создаётся один раз, а копии для строк
+            # наследуют готовый список вместо своего запроса.
+            field.choices = list(field.choices)
+        return field
+
+    def save_model(self, request, obj, form, change):
+        pending = getattr(request, '_bulk_edit', None)
+        if pending is None:
+            return super().save_model(request, obj, form, change)
+        pending.append(obj)
+
+    def changelist_view(self, request, extra_context=None):
+        if not (self.bulk_edit and request.method == 'POST'
+                and '_save' in request.POST):
+            return super().changelist_view(request, extra_context)
+        request._bulk_edit = []
+        with transaction.atomic():
+            response = super().changelist_view(request, extra_context)
+            if request._bulk_edit:
+                self.bulk_save(request, request._bulk_edit)
+        return response
+
+    def bulk_fields(self):
+        return list(self.list_editable)
+
+    def bulk_save(self, request, objs):
+        """Сохраняет правки списка; сигналы post_save не отправляются."""
+        self.model.objects.bulk_update(objs, self.bulk_fields())
+
+
+class PostAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = ('pk',
                     'text',
                     'pub_date',
@@ -11,9 +84,42 @@ class PostAdmin(admin.ModelAdmin):
                     'group'
                     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    raw_id_fields = ('author',)
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    # Диапазоны по датам читаются по индексу (-pub_date, -id).
+    date_hierarchy = 'pub_date'
     empty_value_display = '-пусто-'
+    # Загрузки из админки проходят тот же ingest, что и на сайте.
+    form = AdminPostForm
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по тексту идёт через индекс FTS5, а не LIKE '%...%'.
+        match = search.match_expression(search_term)
+        if match is None or not search.available():
+            return super().get_search_results(request, queryset,
+                                              search_term)
+        return search.filter_matching(queryset, match), False
+
+    def bulk_fields(self):
+        return super().bulk_fields() + ['updated']
+
+    def bulk_save(self, request, objs):
+        # bulk_update не вызывает auto_now и сигналы: дата изменения
+        # (версия карточки) и счётчики групп обновляются здесь.
+        now = timezone.now()
+        groups = set()
+        for post in objs:
+            post.updated = now
+            groups.update((post._initial_group_id, post.group_id))
+            post._initial_group_id = post.group_id
+        super().bulk_save(request, objs)
+        counts.reset(*(counts.group_key(group_id)
+                       for group_id in groups if group_id))
+        tags.invalidate(*tags.for_posts(
+            [post.pk for post in objs], {post.author_id for post in objs},
+            groups))
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -25,25 +131,38 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = ('author',
                     'text',
                     )
     list_editable = ('text',
                      )
+    list_select_related = ('author',)
+    raw_id_fields = ('author', 'post')
+    # Имя автора ищется точно, через JOIN по индексу username; текст -
+    # по вхождению, как и раньше: индекса по комментариям нет.
     search_fields = ('text',
-                     'author')
+                     '=author__username')
     empty_value_display = '-пусто-'
 
+    def bulk_save(self, request, objs):
+        # bulk_update не отправляет сигналы: страницы постов сбрасываем сами.
+        super().bulk_save(request, objs)
+        tags.invalidate(*{tags.post_tag(comment.post_id) for comment in objs})
+
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(PerformanceAdminMixin, admin.ModelAdmin):
     list_display = ('user',
                     'author'
                     )
     list_editable = ('author',)
-    search_fields = ('user',
-                     'author')
+    list_select_related = ('user', 'author')
+    raw_id_fields = ('user', 'author')
+    search_fields = ('=user__username',
+                     '=author__username')
     empty_value_display = '-пусто-'
+    # Смена автора подписки должна пройти через сигналы: ленты, счётчики.
+    bulk_edit = False
 
 
 admin.site.register(Post, PostAdmin)
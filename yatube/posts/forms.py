@@ -1,7 +1,9 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.utils.translation import gettext_lazy as _
 
 from .models import Comment, Post
+from .services.images import ingest
 
 
 class PostForm(forms.ModelForm):
@@ -16,6 +18,18 @@ class PostForm(forms.ModelForm):
             'group': _('Выберите группу'),
         }
 
+    def clean_image(self):
+        # Новую картинку сразу готовим к хранению; старую не трогаем.
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return ingest(image)
+        return image
+
+
+class AdminPostForm(PostForm):
+    class Meta(PostForm.Meta):
+        fields = '__all__'
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -24,3 +38,11 @@ class CommentForm(forms.ModelForm):
         labels = {
             'text': _('Текст комментария'),
         }
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(label=_('Найти'), max_length=200)
+    group = forms.SlugField(label=_('Группа'), max_length=50,
+                            required=False)
+    author = forms.CharField(label=_('Автор'), max_length=150,
+                             required=False)
@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from posts.models import Post
+from posts.services import thumbnails
+
+from .benchmark_views import percentile
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск миниатюр страницы по одной на тег и одним '
+            'пакетным запросом (thumbnails.resolve).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10,
+                            help='Постов с картинками на странице.')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def measure(self, run, repeat, cold):
+        timings, queries = [], []
+        for _ in range(repeat):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - start
+            timings.append(elapsed * 1000)
+            queries.append(len(captured.captured_queries))
+        timings.sort()
+        return percentile(timings, 50), percentile(timings, 95), max(queries)
+
+    def handle(self, *args, **options):
+        names = list(Post.objects.exclude(image='').order_by(
+            '-pk').values_list('image', flat=True)[:options['posts']])
+        if not names:
+            raise CommandError('Нет постов с картинками.')
+        presets = list(settings.THUMBNAIL_PRESETS)
+        approaches = {
+            'per-tag': lambda: [thumbnails.lookup(name, preset_name)
+                                for name in names for preset_name in presets],
+            'batched': lambda: thumbnails.resolve(names, presets),
+        }
+        self.stdout.write(f'Картинок: {len(names)}, пресетов: {len(presets)}')
+        for cold in (True, False):
+            for label, run in approaches.items():
+                p50, p95, queries = self.measure(run, options['repeat'], cold)
+                self.stdout.write(
+                    f'{"cold" if cold else "warm":<5} {label:<8} '
+                    f'p50 {p50:>8.3f} ms  p95 {p95:>8.3f} ms  '
+                    f'queries {queries}')
@@ -0,0 +1,151 @@
+import json
+import math
+import subprocess
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(samples, rank):
+    """Перцентиль методом ближайшего ранга по отсортированной выборке."""
+    index = max(0, math.ceil(rank / 100 * len(samples)) - 1)
+    return samples[index]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеряет p50/p95/p99 и число запросов основных страниц через '
+            'тестовый клиент и пишет результат в JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--cold', action='store_true',
+                            help='Чистить кэш перед каждым запросом.')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare',
+                            help='JSON прошлого прогона для сравнения.')
+
+    def scenarios(self):
+        """(имя, клиент, url) для каждой замеряемой страницы."""
+        post = Post.objects.order_by('-pk').first()
+        group = Group.objects.order_by('pk').first()
+        author = User.objects.annotate(
+            number=Count('posts')).order_by('-number').first()
+        reader = User.objects.annotate(
+            number=Count('follower')).order_by('-number').first()
+        commented = Comment.objects.values('post').annotate(
+            number=Count('pk')).order_by('-number').first()
+        if post is None:
+            raise CommandError('Нет постов: сначала generate_dataset.')
+        guest = Client()
+        scenarios = [
+            ('index', guest, reverse('posts:index')),
+            ('index_deep_page', guest,
+             reverse('posts:index') + '?page=%d' % max(
+                 1, Post.objects.count() // 10 // 2)),
+            ('post_detail', guest, reverse(
+                'posts:post_detail',
+                kwargs={'post_id': commented['post'] if commented
+                        else post.pk})),
+            ('profile', guest, reverse(
+                'posts:profile', kwargs={'username': author.username})),
+        ]
+        if group is not None:
+            scenarios.append(('group_list', guest, reverse(
+                'posts:group_list', kwargs={'slug': group.slug})))
+        if Follow.objects.exists():
+            client = Client()
+            client.force_login(reader)
+            scenarios.append(
+                ('follow_index', client, reverse('posts:follow_index')))
+        return scenarios
+
+    def measure(self, client, url, repeat, warmup, cold):
+        for _ in range(warmup):
+            client.get(url)
+        timings, queries = [], []
+        for _ in range(repeat):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise CommandError(f'{url}: ответ {response.status_code}')
+            timings.append(elapsed * 1000)
+            queries.append(len(captured.captured_queries))
+        timings.sort()
+        result = {f'p{rank}_ms': round(percentile(timings, rank), 3)
+                  for rank in PERCENTILES}
+        result['mean_ms'] = round(sum(timings) / len(timings), 3)
+        result['queries'] = max(queries)
+        return result
+
+    def handle(self, *args, **options):
+        report = {
+            'commit': git_commit(),
+            'created': timezone.now().isoformat(),
+            'cold': options['cold'],
+            'repeat': options['repeat'],
+            'dataset': {
+                'users': User.objects.count(),
+                'posts': Post.objects.count(),
+                'comments': Comment.objects.count(),
+                'follows': Follow.objects.count(),
+            },
+            'views': {},
+        }
+        for name, client, url in self.scenarios():
+            result = self.measure(client, url, options['repeat'],
+                                  options['warmup'], options['cold'])
+            report['views'][name] = result
+            self.stdout.write(
+                f'{name:<16} p50 {result["p50_ms"]:>9.2f} ms  '
+                f'p95 {result["p95_ms"]:>9.2f} ms  '
+                f'p99 {result["p99_ms"]:>9.2f} ms  '
+                f'queries {result["queries"]}')
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+        if options['compare']:
+            self.compare(options['compare'], report)
+
+    def compare(self, path, report):
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+        self.stdout.write(f'Сравнение с {baseline.get("commit") or path}:')
+        for name, result in report['views'].items():
+            before = baseline['views'].get(name)
+            if before is None:
+                continue
+            deltas = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+                change = (result[key] - before[key]) / before[key] * 100 \
+                    if before[key] else 0
+                deltas.append(f'{key[:3]} {change:+.1f}%')
+            deltas.append(
+                f'queries {before["queries"]} -> {result["queries"]}')
+            self.stdout.write(f'{name:<16} ' + '  '.join(deltas))
@@ -0,0 +1,133 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+
+from posts.models import Comment, Follow, Group, Post
+from posts.services import feeds, stats
+from posts.services.importer import reset_sequences
+
+User = get_user_model()
+
+WORDS = (
+    'яндекс практикум джанго пост лента группа автор подписка комментарий '
+    'кэш запрос индекс страница картинка текст новости питон база данных'
+).split()
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу детерминированным синтетическим набором данных '
+            'для бенчмарков (bulk_create, без сигналов).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Подписок на пользователя.')
+        parser.add_argument('--seed', type=int, default=2022)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def text(self, words):
+        return ' '.join(self.random.choice(WORDS) for _ in range(words))
+
+    def next_pk(self, model):
+        return (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+    def create(self, model, objects):
+        """bulk_create пачками; pk задаются заранее, SQLite их не вернёт."""
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) == self.batch_size:
+                model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            groups = self.create_groups(options['groups'])
+            posts = self.create_posts(options['posts'], users, groups)
+            self.create_comments(options['comments'], users, posts)
+            self.create_follows(options['follows'], users)
+            reset_sequences([User, Group, Post, Comment, Follow])
+            feeds.rebuild()
+            stats.reconcile_users()
+            stats.reconcile_posts()
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: пользователей {len(users)}, групп {len(groups)}, '
+            f'постов {len(posts)}, комментариев {options["comments"]}'))
+
+    def create_users(self, number):
+        start = self.next_pk(User)
+        pks = range(start, start + number)
+        self.create(User, (
+            User(pk=pk, username=f'bench_{pk}', password='!',
+                 first_name=self.random.choice(WORDS).title())
+            for pk in pks))
+        return list(pks)
+
+    def create_groups(self, number):
+        start = self.next_pk(Group)
+        pks = range(start, start + number)
+        self.create(Group, (
+            Group(pk=pk, slug=f'bench-{pk}', title=self.text(2),
+                  description=self.text(10))
+            for pk in pks))
+        return list(pks)
+
+    def create_posts(self, number, users, groups):
+        start = self.next_pk(Post)
+        pks = range(start, start + number)
+        # Авторы распределены неравномерно, как в жизни: у немногих
+        # большинство постов.
+        self.create(Post, (
+            Post(pk=pk, text=self.text(self.random.randint(5, 60)),
+                 author_id=users[int(len(users)
+                                     * self.random.random() ** 3)],
+                 group_id=(self.random.choice(groups)
+                           if groups and self.random.random() < 0.7
+                           else None))
+            for pk in pks))
+        return list(pks)
+
+    def create_comments(self, number, users, posts):
+        if not posts:
+            return
+        start = self.next_pk(Comment)
+        self.create(Comment, (
+            Comment(pk=pk, post_id=self.random.choice(posts),
+                    author_id=self.random.choice(users),
+                    text=self.text(self.random.randint(3, 20)))
+            for pk in range(start, start + number)))
+
+    def create_follows(self, per_user, users):
+        per_user = min(per_user, len(users) - 1)
+        start = self.next_pk(Follow)
+
+        def follows():
+            pk = start
+            for user in users:
+                authors = set()
+                while len(authors) < per_user:
+                    author = users[int(len(users)
+                                       * self.random.random() ** 2)]
+                    if author != user:
+                        authors.add(author)
+                for author in sorted(authors):
+                    yield Follow(pk=pk, user_id=user, author_id=author)
+                    pk += 1
+
+        self.create(Follow, follows())
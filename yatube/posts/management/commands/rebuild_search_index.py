@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.services import search
+
+
+class Command(BaseCommand):
+    help = ('Пересоздаёт полнотекстовый индекс постов (FTS5) и его '
+            'триггеры. Нужен после миграций, пересобирающих posts_post.')
+
+    def handle(self, *args, **options):
+        if not search.available():
+            raise CommandError('Полнотекстовый индекс есть только в SQLite.')
+        search.uninstall()
+        search.install()
+        self.stdout.write(self.style.SUCCESS('Индекс поиска пересобран.'))
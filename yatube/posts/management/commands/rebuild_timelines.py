@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.models import Timeline
+from posts.services import counts, feeds
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок из Follow и Post.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Чьи ленты чинить; без аргументов - ленты всех.')
+
+    def handle(self, *args, **options):
+        users = None
+        if options['usernames']:
+            users = list(User.objects.filter(
+                username__in=options['usernames']))
+            missing = set(options['usernames']) - {
+                user.username for user in users}
+            if missing:
+                raise CommandError(
+                    f'Нет пользователей: {", ".join(sorted(missing))}')
+        feeds.rebuild(users)
+        if users is None:
+            users = User.objects.filter(follower__isnull=False).distinct()
+        counts.reset(*(counts.follow_key(user.pk) for user in users))
+        self.stdout.write(self.style.SUCCESS(
+            f'Лент пересобрано, записей: {Timeline.objects.count()}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.services import stats
+
+
+class Command(BaseCommand):
+    help = ('Сверяет денормализованные счётчики (UserStats, '
+            'Post.comments_count) с данными и чинит разошедшиеся пачкой.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = stats.reconcile_users()
+            posts = stats.reconcile_posts()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков: пользователей {users}, постов {posts}'))
@@ -0,0 +1,61 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    # Ленты существующих подписок, как feeds.rebuild(): посты авторов
+    # с числом подписчиков выше порога не раздаются, а тянутся при чтении.
+    Timeline = apps.get_model('posts', 'Timeline')
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    ops = schema_editor.connection.ops
+    follow = Follow._meta.db_table
+    sql = (
+        f'{ops.insert_statement(ignore_conflicts=True)} '
+        f'{Timeline._meta.db_table} (user_id, post_id, author_id, pub_date) '
+        f'SELECT f.user_id, p.id, p.author_id, p.pub_date '
+        f'FROM {follow} f INNER JOIN {Post._meta.db_table} p '
+        f'ON p.author_id = f.author_id '
+        f'WHERE f.author_id NOT IN (SELECT author_id FROM {follow} '
+        f'GROUP BY author_id HAVING COUNT(*) > %s) '
+        f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(sql, [settings.FEED_PULL_THRESHOLD])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0013_auto_20220112_2108'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Timeline',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timeline',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='posts_timeline_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timeline',
+            index=models.Index(fields=['user', 'author'], name='posts_timeline_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timeline',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='posts_timeline_user_post_constraint'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:40
+
+from django.db import migrations
+
+from posts.services import search
+
+
+def install(apps, schema_editor):
+    search.install(schema_editor)
+
+
+def uninstall(apps, schema_editor):
+    search.uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
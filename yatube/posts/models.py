@@ -1,5 +1,5 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
 
 User = get_user_model()
 
@@ -22,17 +22,24 @@ class Post(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
+    # Отдельные индексы по FK не нужны: их покрывают составные из Meta.
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         related_name='posts',
-        verbose_name='Автор'
+        verbose_name='Автор',
+        db_index=False
     )
     group = models.ForeignKey(
         Group,
         on_delete=models.SET_NULL,
         blank=True,
         null=True,
+        db_index=False,
         related_name='posts',
         verbose_name='Группа',
         help_text='Выберите группу'
@@ -42,19 +49,50 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Комментариев',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = (
+            # Порядок полей совпадает с сортировкой лент (-pub_date, -id),
+            # поэтому страницы читаются диапазоном по индексу без сортировки.
+            models.Index(fields=('-pub_date', '-id'),
+                         name='posts_post_pub_date_idx'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='posts_post_author_pub_idx'),
+            models.Index(fields=('group', '-pub_date', '-id'),
+                         name='posts_post_group_pub_idx'),
+        )
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        # Счётчики и ленты обновляются сигналами в той же транзакции.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    @property
+    def card_version(self):
+        """
+        Версия карточки поста для ключа её кэша: меняется при правке
+        поста и при смене имени автора или адреса группы.
+        """
+        group = self.group.slug if self.group_id else ''
+        return (f'{self.updated.timestamp()}:{self.author.username}:'
+                f'{self.author.get_full_name()}:{group}')
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
-        related_name='comments'
+        related_name='comments',
+        db_index=False
     )
     author = models.ForeignKey(
         User,
@@ -68,6 +106,17 @@ class Comment(models.Model):
     )
     created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        ordering = ['created']
+        indexes = (
+            models.Index(fields=('post', 'created', 'id'),
+                         name='posts_comment_post_created_idx'),
+        )
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -78,7 +127,8 @@ class Follow(models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
-        related_name='following'
+        related_name='following',
+        db_index=False
     )
 
     class Meta:
@@ -87,3 +137,63 @@ class Follow(models.Model):
                 fields=('user', 'author'),
                 name='%(app_label)s_%(class)s_user_author_constraint'),
         )
+        indexes = (
+            # Подписчики автора: уникальное ограничение начинается с user.
+            models.Index(fields=('author', 'user'),
+                         name='posts_follow_author_user_idx'),
+        )
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя, их ведут сигналы."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        db_index=True
+    )
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+
+class Timeline(models.Model):
+    """Материализованная лента подписок: строка на пост для подписчика."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='posts_timeline_user_post_constraint'),
+        )
+        indexes = (
+            # Чтение ленты - диапазон по индексу без обращения к таблице.
+            models.Index(fields=('user', '-pub_date', '-post'),
+                         name='posts_timeline_feed_idx'),
+            models.Index(fields=('user', 'author'),
+                         name='posts_timeline_author_idx'),
+        )
@@ -0,0 +1,30 @@
+from django.conf import settings
+
+from .services import decode_cursor, encode_cursor, seek
+
+COMMENT_KEYS = ('created', 'pk')
+
+
+def comment_batch(post, after=None, size=None):
+    """
+    Порция комментариев поста от старых к новым и токен следующей.
+
+    Выборка - диапазон по индексу (post, created, id) вместе с авторами,
+    так что её цена не зависит от числа комментариев под постом.
+    """
+    size = size or settings.COMMENTS_NUMBER
+    bound, number = None, 1
+    cursor = after and decode_cursor(after, COMMENT_KEYS)
+    if cursor:
+        value, pk, number = cursor
+        bound = (value, pk)
+    queryset = post.comments.select_related('author').only(
+        'text', 'created', 'post', 'author__username')
+    # reverse=True в seek - по возрастанию ключа, строго после bound.
+    comments = seek(queryset, bound, True, size + 1, COMMENT_KEYS)
+    next_cursor = None
+    if len(comments) > size:
+        comments = comments[:size]
+        last = comments[-1]
+        next_cursor = encode_cursor(last.created, last.pk, number + 1)
+    return comments, next_cursor
@@ -0,0 +1,64 @@
+import hashlib
+
+from posts.models import Post, User
+
+from . import tags
+
+
+def page_etag(request, *parts):
+    """
+    ETag страницы из версий данных, на которых она построена.
+
+    Разметка зависит и от того, кто смотрит (шапка, кнопки подписки
+    и редактирования), поэтому в тег входит пользователь. Номер страницы
+    не нужен: ETag и так относится к конкретному URL.
+    """
+    user = request.user.pk if request.user.is_authenticated else None
+    return hashlib.md5(repr((user, parts)).encode()).hexdigest()
+
+
+def _once(request, key, load):
+    # Объект читается один раз за запрос: и для ETag, и для страницы.
+    loaded = request.__dict__.setdefault('_conditional_objects', {})
+    if key not in loaded:
+        loaded[key] = load()
+    return loaded[key]
+
+
+def profile_author(request, username):
+    return _once(request, ('profile', username), lambda: User.objects.
+                 select_related('stats').filter(username=username).first())
+
+
+def detail_post(request, post_id):
+    return _once(request, ('post', post_id), lambda: Post.objects.
+                 select_related('author__stats', 'group').
+                 filter(pk=post_id).first())
+
+
+def index_etag(request):
+    return page_etag(request, 'index', tags.version(tags.INDEX))
+
+
+def group_etag(request, slug):
+    return page_etag(request, 'group', slug,
+                     tags.version(tags.group_tag(slug)))
+
+
+def profile_etag(request, username):
+    author = profile_author(request, username)
+    if author is None:
+        return None
+    # Посты автора и подписки на него и его сбрасывают тег автора.
+    return page_etag(request, 'profile', author.pk,
+                     tags.version(tags.author_tag(username)))
+
+
+def post_etag(request, post_id):
+    # Правки поста, его комментариев и группы сбрасывают тег поста;
+    # имя автора и число его постов - тег автора.
+    post = detail_post(request, post_id)
+    if post is None:
+        return None
+    return page_etag(request, 'post', post.pk, *tags.versions(
+        [tags.post_tag(post.pk), tags.author_tag(post.author.username)]))
@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+
+from posts.models import Follow
+
+PREFIX = 'posts:count'
+
+
+def index_key():
+    return f'{PREFIX}:index'
+
+
+def group_key(group_id):
+    return f'{PREFIX}:group:{group_id}'
+
+
+def follow_key(user_id):
+    return f'{PREFIX}:follow:{user_id}'
+
+
+def estimate_rows(model):
+    """Оценка числа строк таблицы по статистике СУБД, без COUNT(*)."""
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass'
+    elif connection.vendor == 'sqlite':
+        # Первое число в sqlite_stat1.stat - строки таблицы (после ANALYZE).
+        sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1'
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None:
+        return None
+    return int(str(row[0]).split()[0])
+
+
+def cached_count(key, queryset):
+    """
+    Число строк выборки из кэша; при промахе считается один раз.
+
+    Для полной таблицы в режиме POSTS_COUNT_ESTIMATE на больших объёмах
+    берётся оценка из статистики СУБД вместо точного COUNT(*).
+    """
+    count = cache.get(key)
+    if count is not None:
+        return count
+    if settings.POSTS_COUNT_ESTIMATE and key == index_key():
+        count = estimate_rows(queryset.model)
+        if count is not None and count < settings.POSTS_COUNT_ESTIMATE_MIN:
+            count = None
+    if count is None:
+        count = queryset.count()
+    cache.add(key, count, settings.POSTS_COUNT_TIMEOUT)
+    return count
+
+
+def adjust(keys, delta):
+    """
+    Сдвигает закэшированные счётчики; отсутствующие досчитаются сами.
+
+    Бэкенд с incr_many (core.sqlite_cache) делает это одной записью,
+    а не транзакцией на каждый ключ.
+    """
+    incr_many = getattr(cache, 'incr_many', None)
+    if incr_many is not None:
+        incr_many(keys, delta)
+        return
+    for key in keys:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass
+
+
+def reset(*keys):
+    cache.delete_many(keys)
+
+
+def follower_keys(author_id):
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    return [follow_key(user_id) for user_id in followers]
+
+
+def post_keys(post, pushed=True):
+    """
+    Ключи лент, в которые попадает пост.
+
+    Счётчик ленты подписок - это число её строк Timeline (посты
+    pull-авторов FollowFeed досчитывает сам), поэтому ключи подписчиков
+    нужны, только если пост раздаётся по лентам (pushed).
+    """
+    keys = [index_key()]
+    if post.group_id:
+        keys.append(group_key(post.group_id))
+    if pushed:
+        keys.extend(follower_keys(post.author_id))
+    return keys
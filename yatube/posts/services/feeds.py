@@ -0,0 +1,187 @@
+import heapq
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from posts.models import Follow, Post, Timeline, UserStats
+
+from . import counts
+from .querysets import feed_queryset
+from .services import seek
+
+TIMELINE_KEYS = ('pub_date', 'post_id')
+PULLED_KEY = 'posts:feed:pulled'
+
+logger = logging.getLogger(__name__)
+
+
+def pulled_authors():
+    """
+    Авторы, у которых подписчиков больше FEED_PULL_THRESHOLD.
+
+    Их посты не раздаются по лентам, а подтягиваются при чтении.
+    Множество общее для записи и чтения и кэшируется, поэтому обе
+    стороны принимают одно и то же решение. Число подписчиков берётся
+    из UserStats по индексу, без группировки всех подписок.
+    """
+    authors = cache.get(PULLED_KEY)
+    if authors is None:
+        authors = set(UserStats.objects.filter(
+            followers_count__gt=settings.FEED_PULL_THRESHOLD
+        ).values_list('user_id', flat=True))
+        cache.set(PULLED_KEY, authors, settings.FEED_PULL_TIMEOUT)
+    return authors
+
+
+def hydrate(post_ids):
+    """Посты по списку id в том же порядке, одним запросом."""
+    posts = feed_queryset().in_bulk(post_ids)
+    return [posts[pk] for pk in post_ids if pk in posts]
+
+
+class FollowFeed:
+    """
+    Гибридная лента подписок: push из Timeline плюс pull популярных авторов.
+
+    Push-часть - диапазон по индексу (user, -pub_date, -post) с одними
+    id постов. Каждый pull-автор - отдельный диапазон по его постам.
+    Потоки сливаются k-way слиянием по (pub_date, id), сами посты
+    догружаются одним запросом. Объект понимает и срезы (для ?page=N),
+    и seek (для курсорной пагинации); в stats - сколько постов страницы
+    пришло из push и из pull.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.entries = Timeline.objects.filter(user=user).values_list(
+            'pub_date', 'post_id')
+        followed = Follow.objects.filter(user=user).values_list(
+            'author_id', flat=True)
+        self.pulled = sorted(pulled_authors().intersection(followed))
+        self.stats = {'push': 0, 'pull': 0}
+
+    def _pull(self, author_id):
+        return Post.objects.filter(author_id=author_id).values_list(
+            'pub_date', 'pk')
+
+    def count(self):
+        # Push-часть кэшируется по follow_key, pull-часть - из UserStats.
+        pushed = counts.cached_count(counts.follow_key(self.user.pk),
+                                     self.entries)
+        if not self.pulled:
+            return pushed
+        pulled = UserStats.objects.filter(user_id__in=self.pulled).aggregate(
+            total=Sum('posts_count'))['total'] or 0
+        return pushed + pulled
+
+    def seek(self, bound, reverse=False, limit=None):
+        pushed = seek(self.entries, bound, reverse, limit, TIMELINE_KEYS)
+        streams = [[(*row, 'push') for row in pushed]]
+        for author_id in self.pulled:
+            rows = seek(self._pull(author_id), bound, reverse, limit)
+            streams.append([(*row, 'pull') for row in rows])
+        merged = heapq.merge(*streams, reverse=not reverse)
+        post_ids, seen = [], set()
+        self.stats = {'push': 0, 'pull': 0}
+        for _, post_id, source in merged:
+            # Пост мог попасть в ленту до того, как автор стал pull.
+            if post_id in seen:
+                continue
+            seen.add(post_id)
+            post_ids.append(post_id)
+            self.stats[source] += 1
+            if limit is not None and len(post_ids) == limit:
+                break
+        logger.info('follow feed user=%s push=%d pull=%d',
+                    self.user.pk, self.stats['push'], self.stats['pull'])
+        return hydrate(post_ids)
+
+    def __getitem__(self, index):
+        posts = self.seek(None, limit=index.stop)
+        return posts[index]
+
+
+def _fill(where, params):
+    """INSERT ... SELECT постов авторов в ленты их подписчиков."""
+    timeline = Timeline._meta.db_table
+    follow = Follow._meta.db_table
+    post = Post._meta.db_table
+    sql = (
+        f'{connection.ops.insert_statement(ignore_conflicts=True)} '
+        f'{timeline} (user_id, post_id, author_id, pub_date) '
+        f'SELECT f.user_id, p.id, p.author_id, p.pub_date '
+        f'FROM {follow} f INNER JOIN {post} p ON p.author_id = f.author_id '
+        f'WHERE {where} '
+        f'{connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def push(post):
+    """
+    Fan-out on write: новый пост попадает в ленты всех подписчиков.
+
+    Возвращает False для pull-автора: его пост по лентам не раздаётся.
+    """
+    if post.author_id in pulled_authors():
+        return False
+    _fill('p.id = %s', [post.pk])
+    return True
+
+
+def backfill(follow):
+    """Подписка: в ленту подписчика добавляются все посты автора."""
+    if follow.author_id not in pulled_authors():
+        _fill('f.id = %s', [follow.pk])
+
+
+def release(author_id):
+    """
+    Вызывается после отписки, когда followers_count уже уменьшен.
+
+    Если отписка опустила автора до FEED_PULL_THRESHOLD, его посты,
+    написанные в pull-режиме, раздаются подписчикам сейчас: иначе,
+    перестав подтягиваться при чтении, они пропали бы из их лент.
+    Переход определяется по счётчику до и после отписки, а не по
+    кэшу pull_authors, который мог истечь и пересчитаться по новому
+    значению. Возвращает True, если ленты подписчиков изменились.
+    """
+    followers = UserStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', flat=True).first()
+    if followers is None:
+        return False
+    threshold = settings.FEED_PULL_THRESHOLD
+    if not followers + 1 > threshold >= followers:
+        return False
+    cache.delete(PULLED_KEY)
+    _fill('f.author_id = %s', [author_id])
+    return True
+
+
+def prune(follow):
+    """Отписка: из ленты убираются посты автора."""
+    Timeline.objects.filter(user_id=follow.user_id,
+                            author_id=follow.author_id).delete()
+
+
+@transaction.atomic
+def rebuild(users=None):
+    """Пересобирает ленты указанных пользователей (или всех) с нуля."""
+    cache.delete(PULLED_KEY)
+    pulled = list(pulled_authors()) or [0]
+    where = f'f.author_id NOT IN ({", ".join(["%s"] * len(pulled))})'
+    entries = Timeline.objects.all()
+    if users is None:
+        entries.delete()
+        _fill(where, pulled)
+        return
+    user_ids = [user.pk for user in users]
+    entries.filter(user_id__in=user_ids).delete()
+    if user_ids:
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        _fill(f'{where} AND f.user_id IN ({placeholders})',
+              pulled + user_ids)
@@ -0,0 +1,64 @@
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+# Тег EXIF Orientation.
+ORIENTATION = 0x0112
+# Форматы, которые пересохраняются без потери анимации и палитры.
+REENCODE = {'JPEG', 'PNG', 'WEBP'}
+
+
+def needs_ingest(image):
+    """Нужно ли пересохранять: большое, повёрнуто или несёт EXIF."""
+    if max(image.size) > settings.IMAGE_MASTER_SIZE:
+        return True
+    return bool(image.info.get('exif')) or (
+        image.getexif().get(ORIENTATION, 1) != 1)
+
+
+def ingest(upload):
+    """
+    Готовит загруженную картинку к хранению.
+
+    Размеры берутся из заголовка, без декодирования, и картинка больше
+    IMAGE_MAX_PIXELS отклоняется (защита от decompression bomb). Большая
+    картинка уменьшается до IMAGE_MASTER_SIZE по длинной стороне -
+    JPEG ещё при декодировании (draft), - поворачивается по EXIF
+    и сохраняется без EXIF. Имя и формат файла не меняются.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка слишком большая: %(width)s×%(height)s пикселей.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height})
+    if (image.format not in REENCODE or getattr(image, 'is_animated', False)
+            or not needs_ingest(image)):
+        upload.seek(0)
+        return upload
+    size = (settings.IMAGE_MASTER_SIZE, settings.IMAGE_MASTER_SIZE)
+    image_format = image.format
+    if image_format == 'JPEG':
+        image.draft('RGB', size)
+    icc_profile = image.info.get('icc_profile')
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(size, Image.LANCZOS)
+    options = {'optimize': True, 'exif': b''}
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    if image_format == 'JPEG':
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        options.update(quality=settings.IMAGE_MASTER_QUALITY,
+                       progressive=True)
+    elif image_format == 'WEBP':
+        options['quality'] = settings.IMAGE_MASTER_QUALITY
+    output = BytesIO()
+    image.save(output, image_format, **options)
+    return SimpleUploadedFile(upload.name, output.getvalue(),
+                              content_type=upload.content_type)
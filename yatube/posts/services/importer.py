@@ -0,0 +1,205 @@
+import json
+from collections import Counter
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post, User
+
+# Порядок важен: строки ссылаются на модели выше по списку.
+MODELS = {
+    'auth.user': User,
+    'posts.group': Group,
+    'posts.post': Post,
+    'posts.comment': Comment,
+    'posts.follow': Follow,
+}
+# Уже существующие пользователи и группы не дублируются, а
+# сопоставляются по этим полям.
+NATURAL_KEYS = {'auth.user': 'username', 'posts.group': 'slug'}
+# Даты из архива вместо auto_now/auto_now_add, которые bulk_create
+# иначе перезапишет текущим временем.
+DATE_FIELDS = ((Post, 'pub_date'), (Post, 'updated'), (Comment, 'created'))
+# Скобки массива dumpdata пропускаются вместе с запятыми и переводами
+# строк: сами записи - объекты и целиком разбираются raw_decode.
+SEPARATORS = ' \t\r\n,[]'
+READ_SIZE = 64 * 1024
+
+
+def iter_records(stream, read_size=None):
+    """
+    Объекты JSON-массива (формат dumpdata) или NDJSON по одному.
+
+    Файл читается кусками по read_size, и в памяти одновременно
+    только хвост буфера с текущим объектом.
+    """
+    read_size = read_size or READ_SIZE
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    while True:
+        while position < len(buffer) and buffer[position] in SEPARATORS:
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            chunk = stream.read(read_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        try:
+            record, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # Объект оборван концом куска - дочитываем.
+            if eof:
+                raise
+            chunk = stream.read(read_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        yield record
+
+
+def reset_sequences(models):
+    """
+    Сдвигает последовательности pk за максимум, как loaddata: после
+    вставки с заданными pk PostgreSQL иначе выдаст занятые значения.
+    """
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+@contextmanager
+def archive_dates():
+    saved = []
+    for model, name in DATE_FIELDS:
+        field = model._meta.get_field(name)
+        saved.append((field, field.auto_now, field.auto_now_add))
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Importer:
+    """
+    Потоковый импорт пользователей, групп, постов, комментариев и
+    подписок через bulk_create, без сигналов.
+
+    pk новых строк назначаются заранее (SQLite не возвращает их из
+    bulk_create), а внешние ключи переводятся через карту
+    «pk в архиве -> pk в базе»; последовательности pk в конце
+    сдвигаются за новые строки. В памяти - только эта карта (целые
+    числа) и текущие пачки. Ссылка на строку, которой не было выше
+    в архиве, не импортируется и считается в orphans.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.ids = {label: {} for label in MODELS}
+        self.next_pk = {
+            label: (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+            for label, model in MODELS.items()}
+        self.pending = {label: [] for label in MODELS}
+        self.created = Counter()
+        self.skipped = Counter()
+        self.orphans = Counter()
+        self.last_label = None
+
+    def run(self, records, chunk_size=10000, progress=None):
+        """Импорт транзакциями по chunk_size записей архива."""
+        records = iter(records)
+        with archive_dates():
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    break
+                with transaction.atomic():
+                    for record in chunk:
+                        self.add(record)
+                    self.flush()
+                if progress is not None:
+                    progress(self)
+        reset_sequences(list(MODELS.values()))
+
+    def add(self, record):
+        label = record.get('model')
+        if label not in MODELS:
+            self.skipped[label] += 1
+            return
+        if label != self.last_label:
+            # Ссылки новой модели могут вести в ещё не записанные пачки.
+            self.flush()
+            self.last_label = label
+        obj = self.build(label, record)
+        if obj is None:
+            self.orphans[label] += 1
+            return
+        self.pending[label].append((record.get('pk'), obj))
+        if len(self.pending[label]) >= self.batch_size:
+            self.flush_model(label)
+
+    def build(self, label, record):
+        model = MODELS[label]
+        values = {}
+        for name, value in record.get('fields', {}).items():
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if field.many_to_many or field.auto_created:
+                continue
+            if field.is_relation:
+                if value is None:
+                    values[field.attname] = None
+                    continue
+                target = field.related_model._meta.label_lower
+                value = self.ids[target].get(value)
+                if value is None:
+                    return None
+                values[field.attname] = value
+            else:
+                values[name] = field.to_python(value)
+        if model is Post:
+            values.setdefault('pub_date', timezone.now())
+            values.setdefault('updated', values['pub_date'])
+            values['comments_count'] = 0
+        elif model is Comment:
+            values.setdefault('created', timezone.now())
+        return model(**values)
+
+    def flush(self):
+        for label in MODELS:
+            self.flush_model(label)
+
+    def flush_model(self, label):
+        batch = self.pending[label]
+        if not batch:
+            return
+        self.pending[label] = []
+        model = MODELS[label]
+        existing = {}
+        key = NATURAL_KEYS.get(label)
+        if key is not None:
+            existing = dict(model.objects.filter(**{
+                f'{key}__in': [getattr(obj, key) for _, obj in batch]
+            }).values_list(key, 'pk'))
+        new = []
+        for source_pk, obj in batch:
+            if key is not None and getattr(obj, key) in existing:
+                self.ids[label][source_pk] = existing[getattr(obj, key)]
+                continue
+            obj.pk = self.next_pk[label]
+            self.next_pk[label] += 1
+            self.ids[label][source_pk] = obj.pk
+            new.append(obj)
+        # Повтор подписки из архива не должен ронять весь импорт.
+        model.objects.bulk_create(new, ignore_conflicts=model is Follow)
+        self.created[label] += len(new)
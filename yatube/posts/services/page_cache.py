@@ -0,0 +1,58 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.utils.translation import get_language
+
+from . import tags as cache_tags
+
+# Параметры, от которых зависит страница; остальные (utm_* и т. п.)
+# в ключ не входят.
+PAGE_PARAMS = ('page', 'after', 'before')
+CONDITIONAL_HEADERS = ('HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE')
+
+
+def page_key(request):
+    params = [request.GET.get(name, '') for name in PAGE_PARAMS]
+    raw = '|'.join((get_language() or '', request.path, *params))
+    return f'posts:page:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def _cacheable(response):
+    return (response.status_code == 200 and not response.streaming
+            and not response.cookies)
+
+
+def anonymous_page(tags):
+    """
+    Кэширует страницу целиком для анонимных GET-запросов.
+
+    Анонимность определяется по отсутствию cookie сессии, так что
+    попадание не трогает ни сессию, ни БД: один get_many по ключу
+    страницы и версиям её тегов. tags(**kwargs) - теги страницы
+    по аргументам view; их сброс (posts.services.tags) убирает её.
+    Пересборку защищает tags.fetch: один воркер собирает, остальные
+    отдают старую копию или ждут его.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (not settings.PAGE_CACHE_TIMEOUT
+                    or request.method not in ('GET', 'HEAD')
+                    or settings.SESSION_COOKIE_NAME in request.COOKIES):
+                return view(request, *args, **kwargs)
+            # В кэш и соседним запросам идёт полный ответ, а 304 каждому
+            # запросу отвечается уже по его собственным заголовкам.
+            conditional = {name: request.META.pop(name)
+                           for name in CONDITIONAL_HEADERS
+                           if name in request.META}
+            response = cache_tags.fetch(
+                page_key(request), tags(**kwargs),
+                lambda: view(request, *args, **kwargs),
+                settings.PAGE_CACHE_TIMEOUT, _cacheable)
+            request.META.update(conditional)
+            return get_conditional_response(
+                request, etag=response.get('ETag'), response=response)
+        return wrapper
+    return decorator
@@ -0,0 +1,30 @@
+from django.db.models import Count
+
+from posts.models import Post
+
+# Всё, что показывает карточка поста, и ничего сверх этого
+CARD_FIELDS = (
+    'text',
+    'pub_date',
+    'updated',
+    'image',
+    'author',
+    'author__username',
+    'author__first_name',
+    'author__last_name',
+    'group',
+    'group__slug',
+)
+
+
+def feed_queryset(queryset=None, with_comment_count=False):
+    """
+    Выборка постов для лент: автор и группа одним JOIN, только колонки
+    карточки; по запросу - число комментариев в comment_count.
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    queryset = queryset.select_related('author', 'group').only(*CARD_FIELDS)
+    if with_comment_count:
+        queryset = queryset.annotate(comment_count=Count('comments'))
+    return queryset
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare
+from django.utils.html import format_html
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from . import thumbnails
+
+SALT = 'posts.resize'
+WEBP = 'image/webp'
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': WEBP,
+}
+
+
+def widths(preset_name):
+    """Ширины вариантов пресета для srcset."""
+    return tuple(settings.THUMBNAIL_PRESETS[preset_name].get('widths', ()))
+
+
+def signature(name, preset_name, width):
+    value = f'{preset_name}:{width}:{name}'
+    return signing.Signer(salt=SALT).signature(value)
+
+
+def allowed(name, preset_name, width, sign):
+    """Подпись верна, а пресет и ширина есть в реестре."""
+    if preset_name not in settings.THUMBNAIL_PRESETS:
+        return False
+    if width not in widths(preset_name):
+        return False
+    return constant_time_compare(sign,
+                                 signature(name, preset_name, width))
+
+
+def url(name, preset_name, width):
+    return reverse('posts:resized_image', kwargs={
+        'preset': preset_name,
+        'width': width,
+        'signature': signature(name, preset_name, width),
+        'name': name,
+    })
+
+
+def srcset(name, preset_name):
+    """Атрибуты srcset и sizes для <img> по ширинам пресета."""
+    candidates = ', '.join(f'{url(name, preset_name, width)} {width}w'
+                           for width in widths(preset_name))
+    if not candidates:
+        return ''
+    sizes = settings.THUMBNAIL_PRESETS[preset_name].get('sizes', '100vw')
+    return format_html('srcset="{}" sizes="{}"', candidates, sizes)
+
+
+def negotiate(accept, name):
+    """WebP, если клиент его принимает, иначе формат оригинала."""
+    for item in accept.split(','):
+        media_type, *params = [part.strip() for part in item.split(';')]
+        if media_type == WEBP:
+            if not any(param.replace(' ', '') in ('q=0', 'q=0.0')
+                       for param in params):
+                return 'WEBP'
+            break
+    return thumbnails.backend._get_format(ImageFile(name))
+
+
+def geometry(preset_name, width):
+    """Геометрия варианта: ширина и высота в пропорциях пресета."""
+    base, options = thumbnails.preset(preset_name)
+    base_width, _, base_height = base.partition('x')
+    if not base_height:
+        return str(width), options
+    height = round(width * int(base_height) / int(base_width))
+    return f'{width}x{height}', options
+
+
+def variant(name, preset_name, width, image_format):
+    """
+    Вариант изображения заданной ширины и формата.
+
+    Готовый вариант лежит в кэше sorl на диске и находится по kvstore;
+    создаётся он один раз, под той же блокировкой, что и миниатюры.
+    """
+    geometry_string, options = geometry(preset_name, width)
+    options['format'] = image_format
+    thumbnail = thumbnails.backend.lookup(name, geometry_string, **options)
+    if thumbnail is None:
+        lock_name = f'{preset_name}:{width}:{image_format}'
+        with thumbnails.image_lock(name, lock_name):
+            thumbnail = thumbnails.backend.get_thumbnail(
+                name, geometry_string, **options)
+    if not default.storage.exists(thumbnail.name):
+        return None
+    return thumbnail
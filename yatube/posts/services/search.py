@@ -0,0 +1,166 @@
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .querysets import feed_queryset
+
+TABLE = 'posts_post_fts'
+SEARCH_KEYS = ('rank', 'pk')
+WORD = re.compile(r'\w+')
+# Маркеры подсветки: в тексте постов их нет, и escape() их не трогает.
+MARK_OPEN, MARK_CLOSE = '\x02', '\x03'
+
+# Индекс с внешним содержимым: текст хранится только в posts_post,
+# триггеры держат индекс в синхроне при любой записи, включая bulk_create.
+SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+    f"text, content='posts_post', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {TABLE}_ai AFTER INSERT ON posts_post "
+    f"BEGIN INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text); END",
+    f"CREATE TRIGGER IF NOT EXISTS {TABLE}_ad AFTER DELETE ON posts_post "
+    f"BEGIN INSERT INTO {TABLE}({TABLE}, rowid, text) "
+    f"VALUES ('delete', old.id, old.text); END",
+    f"CREATE TRIGGER IF NOT EXISTS {TABLE}_au AFTER UPDATE OF text "
+    f"ON posts_post BEGIN INSERT INTO {TABLE}({TABLE}, rowid, text) "
+    f"VALUES ('delete', old.id, old.text); "
+    f"INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text); END",
+    f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')",
+)
+DROP = (
+    f'DROP TRIGGER IF EXISTS {TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {TABLE}_au',
+    f'DROP TABLE IF EXISTS {TABLE}',
+)
+
+
+def available(using=None):
+    return (using or connection).vendor == 'sqlite'
+
+
+def install(schema_editor=None):
+    """
+    Создаёт индекс и триггеры и переиндексирует посты.
+
+    Пересборка таблицы posts_post миграцией SQLite удаляет триггеры,
+    поэтому после неё нужно вызвать install() снова
+    (rebuild_search_index).
+    """
+    target = schema_editor.connection if schema_editor else connection
+    if not available(target):
+        return
+    with target.cursor() as cursor:
+        for sql in SCHEMA:
+            cursor.execute(sql)
+
+
+def uninstall(schema_editor=None):
+    target = schema_editor.connection if schema_editor else connection
+    if not available(target):
+        return
+    with target.cursor() as cursor:
+        for sql in DROP:
+            cursor.execute(sql)
+
+
+def match_expression(query):
+    """Запрос пользователя в выражение MATCH: все слова, по префиксу."""
+    words = WORD.findall(query.lower())
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+
+def filter_matching(queryset, match):
+    """Посты выборки, подходящие под выражение MATCH."""
+    # RawSQL в __in Django оборачивает в лишние скобки, и SQLite видит
+    # скалярный подзапрос, поэтому условие задаётся через extra().
+    return queryset.extra(
+        where=[f'posts_post.id IN '
+               f'(SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s)'],
+        params=[match])
+
+
+def highlight(snippet):
+    return mark_safe(escape(snippet).replace(
+        MARK_OPEN, '<mark>').replace(MARK_CLOSE, '</mark>'))
+
+
+class PostSearch:
+    """
+    Результаты полнотекстового поиска, ранжированные по bm25.
+
+    Как и FollowFeed, понимает seek для CursorPaginator: ключ страницы -
+    (rank, id), так что следующая страница - продолжение по рангу,
+    а не OFFSET. Посты догружаются одним запросом, у каждого есть
+    rank и snippet с подсветкой.
+    """
+
+    def __init__(self, query, group=None, author=None):
+        self.match = match_expression(query)
+        self.group = group
+        self.author = author
+
+    def _where(self):
+        where, params = [f'{TABLE} MATCH %s'], [self.match]
+        if self.group is not None:
+            where.append('p.group_id = %s')
+            params.append(self.group.pk)
+        if self.author is not None:
+            where.append('p.author_id = %s')
+            params.append(self.author.pk)
+        return where, params
+
+    def seek(self, bound, reverse=False, limit=None):
+        if not self.match:
+            return []
+        if not available():
+            return self._fallback(limit) if bound is None else []
+        where, params = self._where()
+        if bound is not None:
+            rank, pk = bound
+            sign = '<' if reverse else '>'
+            where.append(f'({TABLE}.rank {sign} %s '
+                         f'OR ({TABLE}.rank = %s AND p.id {sign} %s))')
+            params.extend((rank, rank, pk))
+        # Равные ранги (одинаковые тексты) упорядочены по id в ту же
+        # сторону: на это опирается условие курсора выше.
+        direction = 'DESC' if reverse else 'ASC'
+        sql = (
+            f'SELECT p.id, {TABLE}.rank, '
+            f'snippet({TABLE}, 0, %s, %s, %s, 16) '
+            f'FROM {TABLE} JOIN posts_post p ON p.id = {TABLE}.rowid '
+            f'WHERE {" AND ".join(where)} '
+            f'ORDER BY {TABLE}.rank {direction}, p.id {direction}'
+        )
+        params = [MARK_OPEN, MARK_CLOSE, '…', *params]
+        if limit is not None:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        posts = feed_queryset().in_bulk([row[0] for row in rows])
+        results = []
+        for pk, rank, snippet in rows:
+            post = posts.get(pk)
+            if post is not None:
+                post.rank = rank
+                post.snippet = highlight(snippet)
+                results.append(post)
+        return results
+
+    def _fallback(self, limit):
+        # Без FTS5 (не SQLite) - простой поиск по вхождению, одна страница.
+        posts = feed_queryset()
+        for word in WORD.findall(self.match):
+            posts = posts.filter(text__icontains=word)
+        if self.group is not None:
+            posts = posts.filter(group=self.group)
+        if self.author is not None:
+            posts = posts.filter(author=self.author)
+        results = list(posts[:limit])
+        for post in results:
+            post.rank, post.snippet = 0, post.text[:200]
+        return results
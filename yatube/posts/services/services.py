@@ -1,10 +1,218 @@
-from django.core.paginator import Paginator
+import json
+import math
+from datetime import datetime
 
-from yatube.settings import PAGES_NUMBER
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 
+from .counts import cached_count
 
-def get_paginator(request, page):
-    paginator = Paginator(page, PAGES_NUMBER)
+KEYSET = ('pub_date', 'pk')
+# Поля ключа, значения которых - числа (ранг FTS5), а не даты.
+NUMERIC_KEYS = frozenset({'rank'})
+# Границы pk (BIGINT) и номера страницы в токене.
+MAX_PK = 2 ** 63 - 1
+MAX_PAGE = 2 ** 31 - 1
+
+
+def encode_cursor(value, pk, number):
+    """Упаковывает позицию в ленте в непрозрачный токен для URL."""
+    if isinstance(value, datetime):
+        # Полная точность: иначе соседние посты склеятся на границе.
+        value = value.isoformat()
+    raw = json.dumps([value, pk, number])
+    return urlsafe_base64_encode(raw.encode())
+
+
+def _is_int(value, top):
+    return (isinstance(value, int) and not isinstance(value, bool)
+            and 1 <= value <= top)
+
+
+def _cursor_value(value, numeric):
+    if numeric:
+        if (isinstance(value, (int, float)) and not isinstance(value, bool)
+                and math.isfinite(value)):
+            return value
+        return None
+    if not isinstance(value, str):
+        return None
+    try:
+        value = parse_datetime(value)
+    except ValueError:
+        # Формат верный, но даты нет: 2020-13-45.
+        return None
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def decode_cursor(token, keys=KEYSET):
+    """
+    Возвращает (value, pk, number) или None для битого токена.
+
+    Токен приходит из URL, поэтому проверяется всё: value - дата или,
+    для ключей из NUMERIC_KEYS, число; pk и номер страницы - целые
+    в разумных границах.
+    """
+    try:
+        cursor = json.loads(urlsafe_base64_decode(token))
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(cursor, list) or len(cursor) != 3:
+        return None
+    value, pk, number = cursor
+    value = _cursor_value(value, keys[0] in NUMERIC_KEYS)
+    if (value is None or not _is_int(pk, MAX_PK)
+            or not _is_int(number, MAX_PAGE)):
+        return None
+    return value, pk, number
+
+
+def seek(queryset, bound=None, reverse=False, limit=None, keys=KEYSET):
+    """
+    Keyset-выборка: записи строго после bound в порядке ленты
+    (новые сверху), а при reverse=True - строго до него, от старых к новым.
+    """
+    field, pk = keys
+    if bound is not None:
+        value, key = bound
+        if reverse:
+            queryset = queryset.filter(**{f'{field}__gte': value}).exclude(
+                **{field: value, f'{pk}__lte': key})
+        else:
+            queryset = queryset.filter(**{f'{field}__lte': value}).exclude(
+                **{field: value, f'{pk}__gte': key})
+    ordering = (field, pk) if reverse else (f'-{field}', f'-{pk}')
+    queryset = queryset.order_by(*ordering)
+    if limit is not None:
+        queryset = queryset[:limit]
+    return list(queryset)
+
+
+class WindowPaginator(Paginator):
+    """
+    Paginator, у которого page_range ограничен окном вокруг страницы,
+    а общее число записей берётся из кэша счётчиков по count_key
+    (или передаётся готовым в total, например из UserStats).
+    """
+
+    window = settings.PAGINATION_WINDOW
+    current = 1
+
+    def __init__(self, object_list, per_page, count_key=None, total=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.total = total
+
+    @cached_property
+    def count(self):
+        if self.total is not None:
+            return self.total
+        if self.count_key is None:
+            return super().count
+        return cached_count(self.count_key, self.object_list)
+
+    def page(self, number):
+        page = super().page(number)
+        self.current = page.number
+        return page
+
+    @property
+    def page_range(self):
+        first = max(1, self.current - self.window)
+        last = min(self.num_pages, self.current + self.window)
+        return range(first, last + 1)
+
+
+class CursorPaginator(Paginator):
+    """
+    Постраничный вывод по ключу (pub_date, id) без OFFSET и COUNT(*).
+
+    Страница выбирается токенами ?after=/?before=, поэтому её цена
+    не зависит от глубины. Номер страницы едет внутри токена и нужен
+    только для отображения.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, keys=KEYSET, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.keys = keys
+        self.number = self.num_pages = 1
+
+    def _key(self, obj):
+        field, pk = self.keys
+        return getattr(obj, field), getattr(obj, pk)
+
+    def _seek(self, bound, reverse, limit):
+        fetch = getattr(self.object_list, 'seek', None)
+        if fetch is not None:
+            return fetch(bound, reverse=reverse, limit=limit)
+        return seek(self.object_list, bound, reverse, limit, self.keys)
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу по токену; битый токен - первая страница."""
+        after = after and decode_cursor(after, self.keys)
+        before = before and decode_cursor(before, self.keys)
+        limit = self.per_page + 1
+        if before:
+            value, pk, number = before
+            rows = self._seek((value, pk), True, limit)
+            if not rows:
+                return self.get_page()
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            number = max(number, 2) if has_previous else 1
+            has_next = True
+        else:
+            bound, number = None, 1
+            if after:
+                value, pk, number = after
+                bound, number = (value, pk), max(number, 2)
+            rows = self._seek(bound, False, limit)
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        self.number = number
+        self.num_pages = number + 1 if has_next else number
+        page = Page(rows, number, self)
+        page.next_cursor = page.previous_cursor = None
+        if rows and has_next:
+            page.next_cursor = encode_cursor(*self._key(rows[-1]), number + 1)
+        if rows and number > 1:
+            page.previous_cursor = encode_cursor(
+                *self._key(rows[0]), number - 1)
+        return page
+
+    def validate_number(self, number):
+        return int(number)
+
+    @property
+    def page_range(self):
+        # Токены есть только у соседних страниц, окно - на шаг в обе стороны.
+        return range(max(1, self.number - 1), self.num_pages + 1)
+
+
+def page_key(request):
+    """Часть ключа кэша, различающая страницы одной ленты."""
+    return ':'.join(request.GET.get(name, '')
+                    for name in ('page', 'after', 'before'))
+
+
+def get_paginator(request, page, count_key=None, total=None):
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    cursor_mode = settings.PAGINATION_CURSOR and 'page' not in request.GET
+    if after or before or cursor_mode:
+        paginator = CursorPaginator(page, settings.PAGES_NUMBER)
+        return paginator.get_page(after=after, before=before)
+    paginator = WindowPaginator(page, settings.PAGES_NUMBER, count_key,
+                                total)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
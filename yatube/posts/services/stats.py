@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from posts.models import Comment, Follow, Post, UserStats
+
+User = get_user_model()
+
+
+def _shifted(**deltas):
+    # Greatest не даёт уйти в минус, если счётчик уже разошёлся с данными.
+    return {field: Greatest(F(field) + delta, 0)
+            for field, delta in deltas.items()}
+
+
+def shift_user(user_id, **deltas):
+    """
+    Сдвигает счётчики пользователя одним UPDATE.
+
+    Нет строки - ничего не делаем: её досчитает stats_for при чтении.
+    """
+    UserStats.objects.filter(user_id=user_id).update(**_shifted(**deltas))
+
+
+def shift_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        **_shifted(comments_count=delta))
+
+
+def _count(queryset, field):
+    """Подзапрос COUNT(*) по связанной таблице для UPDATE и annotate."""
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(number=Count('pk')).values('number')
+    ), 0)
+
+
+def user_counts():
+    return {
+        'posts_count': _count(Post.objects.all(), 'author'),
+        'followers_count': _count(Follow.objects.all(), 'author'),
+        'following_count': _count(Follow.objects.all(), 'user'),
+    }
+
+
+def post_counts():
+    return {'comments_count': _count(Comment.objects.all(), 'post')}
+
+
+def _reconcile(queryset, expected):
+    """Сколько строк разошлось с данными; их и исправляет."""
+    drift = Q()
+    for field in expected:
+        drift |= ~Q(**{field: F(f'expected_{field}')})
+    drifted = list(queryset.annotate(**{
+        f'expected_{field}': value for field, value in expected.items()
+    }).filter(drift).values_list('pk', flat=True))
+    for start in range(0, len(drifted), 500):
+        queryset.model.objects.filter(
+            pk__in=drifted[start:start + 500]).update(**expected)
+    return len(drifted)
+
+
+def reconcile_users(users=None):
+    """Создаёт недостающие UserStats и пересчитывает разошедшиеся."""
+    users = User.objects.all() if users is None else users
+    missing = users.filter(stats__isnull=True).values_list('pk', flat=True)
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in missing], ignore_conflicts=True)
+    return _reconcile(
+        UserStats.objects.filter(user__in=users.values('pk')), user_counts())
+
+
+def reconcile_posts(posts=None):
+    posts = Post.objects.all() if posts is None else posts
+    return _reconcile(posts, post_counts())
+
+
+def stats_for(user):
+    """UserStats пользователя; при отсутствии строки считается на месте."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        reconcile_users(User.objects.filter(pk=user.pk))
+        user.stats = UserStats.objects.get(user=user)
+        return user.stats
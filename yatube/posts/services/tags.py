@@ -0,0 +1,225 @@
+import math
+import pickle
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from posts.models import Group, User
+
+# Лента главной страницы; группы, авторы и посты - свои теги.
+INDEX = 'listing:index'
+# Шаг опроса кэша, пока запись собирает другой процесс, секунд.
+WAIT_STEP = 0.05
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def post_tag(post_id):
+    return f'post:{post_id}'
+
+
+def group_tag(slug):
+    return f'group:{slug}'
+
+
+def author_tag(username):
+    return f'author:{username}'
+
+
+def _key(tag):
+    return f'posts:tag:{tag}'
+
+
+def versions(tags, found=None):
+    """
+    Текущие версии тегов одним get_many (или из уже прочитанного found).
+
+    Версия отсутствующего тега берётся от времени, чтобы после вытеснения
+    ключа из кэша тег не вернулся к уже использованной версии.
+    """
+    keys = [_key(tag) for tag in tags]
+    if found is None:
+        found = cache.get_many(keys)
+    current = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            cache.add(key, int(time.time() * 1000), None)
+            version = cache.get(key)
+        current.append(version)
+    return tuple(current)
+
+
+def version(tag):
+    return versions([tag])[0]
+
+
+def invalidate(*tags):
+    """
+    Сбрасывает всё, что помечено тегами: по одному incr на тег.
+
+    Внутри транзакции версии меняются дважды: сразу, чтобы её собственные
+    чтения (и тесты, которые не коммитят) видели изменение, и после
+    коммита. Иначе параллельный запрос успел бы собрать страницу по
+    старым данным и сохранить её под новой версией на весь срок кэша.
+    """
+    tags = set(tags)
+    _bump(tags)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(tags))
+
+
+def _bump(tags):
+    for tag in tags:
+        try:
+            cache.incr(_key(tag))
+        except ValueError:
+            # Версии нет - нет и записей, собранных с ней.
+            pass
+
+
+def _expiring(expires, delta):
+    """
+    Вероятностное раннее истечение (XFetch): чем ближе срок и чем дольше
+    пересборка, тем вероятнее, что очередной запрос пересоберёт запись
+    заранее, - и истечения у всех воркеров сразу не бывает.
+    """
+    if expires is None:
+        return False
+    jitter = -delta * settings.CACHE_XFETCH_BETA * math.log(
+        1.0 - random.random())
+    return time.time() + jitter >= expires
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _build(key, compute, current, timeout, cacheable):
+    started = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - started
+    if cacheable is None or cacheable(value):
+        # Запись живёт дольше своего срока: после него её ещё можно
+        # отдать, пока один воркер собирает новую.
+        expires = time.time() + timeout if timeout else None
+        stale_timeout = timeout + settings.CACHE_STALE_TTL if timeout else None
+        cache.set(key, (current, value, expires, delta), stale_timeout)
+    return value
+
+
+def _build_locked(key, compute, current, timeout, cacheable):
+    try:
+        return _build(key, compute, current, timeout, cacheable)
+    finally:
+        cache.delete(_lock_key(key))
+
+
+def _wait_for(key, current):
+    """
+    Свежая запись, собранная другим процессом, или None: по таймауту
+    или если блокировка снята без записи (ответ не кэшируется, сборка
+    упала) - тогда ждать больше нечего.
+    """
+    lock = _lock_key(key)
+    deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        found = cache.get_many([key, lock])
+        entry = found.get(key)
+        if entry is not None and entry[0] == current:
+            return entry
+        if lock not in found:
+            return None
+    return None
+
+
+def _build_cold(key, compute, current, timeout, cacheable):
+    if cache.add(_lock_key(key), 1, settings.CACHE_LOCK_TIMEOUT):
+        return _build_locked(key, compute, current, timeout, cacheable)
+    entry = _wait_for(key, current)
+    if entry is not None:
+        return entry[1]
+    # Держатель блокировки не успел или ничего не сохранил - собираем сами.
+    return _build(key, compute, current, timeout, cacheable)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = self.error = None
+
+
+def _coalesce(key, build):
+    """
+    Одинаковые одновременные сборки в процессе сливаются в одну:
+    остальные потоки ждут её и получают копию результата.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        finished = flight.done.wait(settings.CACHE_LOCK_WAIT)
+        if finished and flight.error is None:
+            # Копия: ответ дальше меняют middleware каждого запроса.
+            return pickle.loads(flight.value)
+        return build()
+    try:
+        value = build()
+        flight.value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return value
+    except BaseException as error:
+        flight.error = error
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def fetch(key, tags, compute, timeout=None, cacheable=None):
+    """
+    Значение из кэша с тегами или compute(), сохранённое под ними.
+
+    Защита от лавины пересборок:
+    - устаревшую (по сроку или тегам) запись пересобирает один воркер
+      под блокировкой, остальные пока отдают старую копию;
+    - запись пересобирается с вероятностью, растущей к концу срока;
+    - при пустом кэше остальные ждут того, кто держит блокировку,
+      а одинаковые сборки внутри процесса сливаются в одну.
+    Чтение записи и версий тегов - один get_many. cacheable(value)
+    решает, сохранять ли результат (None - всегда).
+    """
+    found = cache.get_many([key, *map(_key, tags)])
+    current = versions(tags, found)
+    entry = found.get(key)
+    if entry is not None:
+        stored, value, expires, delta = entry
+        if stored == current and not _expiring(expires, delta):
+            return value
+        if not cache.add(_lock_key(key), 1, settings.CACHE_LOCK_TIMEOUT):
+            return value
+        return _build_locked(key, compute, current, timeout, cacheable)
+    return _coalesce(key, lambda: _build_cold(
+        key, compute, current, timeout, cacheable))
+
+
+def for_posts(post_ids=(), author_ids=(), group_ids=()):
+    """Теги страниц, где видны посты: сами посты, лента, группы, авторы."""
+    tags = [INDEX, *map(post_tag, post_ids)]
+    group_ids = set(filter(None, group_ids))
+    if group_ids:
+        tags.extend(map(group_tag, Group.objects.filter(
+            pk__in=group_ids).values_list('slug', flat=True)))
+    author_ids = set(filter(None, author_ids))
+    if author_ids:
+        tags.extend(map(author_tag, User.objects.filter(
+            pk__in=author_ids).values_list('username', flat=True)))
+    return tags
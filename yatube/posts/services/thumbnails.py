@@ -0,0 +1,255 @@
+import fcntl
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from posts.models import Post
+
+from . import tags
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+# Ключи пресета для адаптивных картинок, а не опции sorl.
+RESPONSIVE_KEYS = ('widths', 'sizes')
+
+
+class PresetBackend(ThumbnailBackend):
+    """Бэкенд sorl, который умеет искать миниатюру, не создавая её."""
+
+    def thumbnail_options(self, source, options):
+        # Те же опции, что достраивает get_thumbnail: от них зависит имя.
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """ImageFile будущей миниатюры: по нему ищут запись в kvstore."""
+        source = ImageFile(file_)
+        options = self.thumbnail_options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def lookup(self, file_, geometry_string, **options):
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options))
+
+
+backend = PresetBackend()
+
+
+def preset(name):
+    """(геометрия, опции sorl) пресета из THUMBNAIL_PRESETS."""
+    options = dict(settings.THUMBNAIL_PRESETS[name])
+    for key in RESPONSIVE_KEYS:
+        options.pop(key, None)
+    return options.pop('geometry'), options
+
+
+@contextmanager
+def image_lock(name, preset_name):
+    """
+    Межпроцессная блокировка на пару изображение + пресет (flock).
+
+    Файлов блокировок фиксированное число THUMBNAIL_LOCK_SLOTS: пары
+    раскладываются по ним хэшем, и каталог не растёт с числом картинок.
+    Удалять файл после работы нельзя - ждущий процесс захватил бы
+    блокировку уже удалённого файла.
+    """
+    os.makedirs(settings.THUMBNAIL_LOCK_DIR, exist_ok=True)
+    digest = hashlib.sha1(f'{name}:{preset_name}'.encode()).hexdigest()
+    slot = int(digest, 16) % settings.THUMBNAIL_LOCK_SLOTS
+    path = os.path.join(settings.THUMBNAIL_LOCK_DIR, f'{slot}.lock')
+    with open(path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def generate(name, presets=None):
+    """
+    Создаёт миниатюры изображения по всем пресетам.
+
+    Под блокировкой сначала смотрим в kvstore, поэтому второй процесс
+    дождётся первого и возьмёт готовую миниатюру. Возвращает
+    (имя, создана ли хоть одна миниатюра): sorl при ошибке чтения
+    исходника только пишет её в лог и ничего не сохраняет.
+    """
+    created = False
+    for preset_name in presets or settings.THUMBNAIL_PRESETS:
+        geometry, options = preset(preset_name)
+        with image_lock(name, preset_name):
+            if backend.lookup(name, geometry, **options):
+                continue
+            backend.get_thumbnail(name, geometry, **options)
+            created |= bool(backend.lookup(name, geometry, **options))
+    return name, created
+
+
+def lookup(name, preset_name):
+    """Готовая миниатюра или None, если её ещё не создали."""
+    geometry, options = preset(preset_name)
+    return backend.lookup(name, geometry, **options)
+
+
+def resolve(names, presets=None):
+    """
+    Готовые миниатюры набора изображений за один поход в kvstore.
+
+    Вместо запроса на каждый тег - один cache.get_many и один запрос
+    IN по промахам кэша. Возвращает {(имя, пресет): ImageFile или None}.
+    """
+    presets = presets or list(settings.THUMBNAIL_PRESETS)
+    keys = {}
+    for name in set(filter(None, names)):
+        for preset_name in presets:
+            geometry, options = preset(preset_name)
+            try:
+                thumbnail = backend.thumbnail_file(name, geometry, **options)
+            except Exception:
+                logger.warning('bad image name %s', name)
+                continue
+            keys[add_prefix(thumbnail.key)] = (name, preset_name)
+    if not keys:
+        return {}
+    kvstore = default.kvstore
+    if not isinstance(kvstore, KVStore):
+        return {pair: lookup(*pair) for pair in keys.values()}
+    values = kvstore.cache.get_many(list(keys))
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        # Как и sorl, запоминаем и отсутствие записи, чтобы не спрашивать БД.
+        fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(fetched,
+                               thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    resolved = {}
+    for key, pair in keys.items():
+        value = values.get(key)
+        resolved[pair] = (deserialize_image_file(value)
+                          if value and value != EMPTY_VALUE else None)
+    return resolved
+
+
+def prefetch(posts, presets=None):
+    """Кладёт в посты страницы их готовые миниатюры (post.thumbnails)."""
+    presets = presets or list(settings.THUMBNAIL_PRESETS)
+    posts = [post for post in posts if post.image]
+    resolved = resolve([post.image.name for post in posts], presets)
+    for post in posts:
+        post.thumbnails = {preset_name: resolved.get(
+            (post.image.name, preset_name)) for preset_name in presets}
+
+
+def thumbnails_ready(name):
+    """Карточки с этим изображением перерисуются уже с миниатюрой."""
+    posts = Post.objects.filter(image=name)
+    rows = list(posts.values_list('pk', 'author_id', 'group_id'))
+    posts.update(updated=timezone.now())
+    tags.invalidate(*tags.for_posts(*zip(*rows)))
+
+
+def _init_worker():
+    django.setup()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: рабочим не достаются соединения и блокировки родителя.
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker)
+    return _pool
+
+
+def _scheduled_key(name):
+    digest = hashlib.sha1(name.encode()).hexdigest()
+    return f'posts:thumbnails:scheduled:{digest}'
+
+
+def _finish(name, created):
+    # Страницы сбрасываются, только если миниатюра действительно
+    # появилась. После неудачи отметка остаётся: повторная попытка - не
+    # раньше, чем через THUMBNAIL_RETRY_DELAY.
+    if created:
+        cache.delete(_scheduled_key(name))
+        thumbnails_ready(name)
+
+
+def _done(future):
+    try:
+        _finish(*future.result())
+    except Exception:
+        logger.exception('thumbnail generation failed')
+    finally:
+        connections.close_all()
+
+
+def _reset_pool(pool):
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False)
+
+
+def schedule(name):
+    """
+    Отдаёт создание миниатюр пулу процессов, не дожидаясь его.
+
+    Одно изображение ставится в очередь не чаще раза в
+    THUMBNAIL_RETRY_DELAY (отметка cache.add), сколько бы страниц ни
+    нашли его без миниатюры. Сломанный пул пересоздаётся, а ошибка
+    постановки только пишется в лог: пост уже сохранён.
+    """
+    if not name:
+        return
+    key = _scheduled_key(name)
+    if not cache.add(key, 1, settings.THUMBNAIL_RETRY_DELAY):
+        return
+    if settings.THUMBNAIL_SYNC:
+        try:
+            _finish(*generate(name))
+        except Exception:
+            logger.exception('thumbnail generation failed')
+        return
+    pool = get_pool()
+    try:
+        future = pool.submit(generate, name)
+    except (BrokenProcessPool, RuntimeError):
+        logger.exception('thumbnail pool is broken, recreating it')
+        _reset_pool(pool)
+        cache.delete(key)
+        return
+    future.add_done_callback(_done)
@@ -0,0 +1,146 @@
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .services import counts, feeds, stats, tags
+
+
+@receiver(post_init, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    # Поле может быть отложено через only(), тогда не трогаем его.
+    instance._initial_group_id = instance.__dict__.get('group_id')
+
+
+@receiver(post_init, sender=Group)
+def remember_slug(sender, instance, **kwargs):
+    instance._initial_slug = instance.__dict__.get('slug')
+    instance._initial_title = instance.__dict__.get('title')
+
+
+# Раньше count_saved_post: ему нужна ещё прежняя группа поста.
+@receiver((post_save, post_delete), sender=Post)
+def invalidate_post_tags(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tags.invalidate(*tags.for_posts(
+            [instance.pk], [instance.author_id],
+            [instance.group_id, instance._initial_group_id]))
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        pushed = feeds.push(instance)
+        stats.shift_user(instance.author_id, posts_count=1)
+        counts.adjust(counts.post_keys(instance, pushed), 1)
+    elif instance._initial_group_id != instance.group_id:
+        if instance._initial_group_id:
+            counts.adjust(
+                [counts.group_key(instance._initial_group_id)], -1)
+        if instance.group_id:
+            counts.adjust([counts.group_key(instance.group_id)], 1)
+    instance._initial_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    stats.shift_user(instance.author_id, posts_count=-1)
+    pushed = instance.author_id not in feeds.pulled_authors()
+    counts.adjust(counts.post_keys(instance, pushed), -1)
+    if not pushed:
+        # Пост мог попасть в ленты до того, как автор стал pull:
+        # такие счётчики проще пересчитать, чем выяснять.
+        counts.reset(*counts.follower_keys(instance.author_id))
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    instance._initial_username = instance.__dict__.get('username')
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_tags(sender, instance, created, raw=False,
+                           update_fields=None, **kwargs):
+    # Имя автора видно в профиле и на страницах его постов; вход на сайт
+    # (update_fields=['last_login']) их не меняет.
+    if raw or created or update_fields == frozenset({'last_login'}):
+        return
+    usernames = {instance.username, instance._initial_username} - {None}
+    tags.invalidate(*map(tags.author_tag, usernames))
+    instance._initial_username = instance.username
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.shift_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    stats.shift_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        feeds.backfill(instance)
+        stats.shift_user(instance.user_id, following_count=1)
+        stats.shift_user(instance.author_id, followers_count=1)
+    counts.reset(counts.follow_key(instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    feeds.prune(instance)
+    stats.shift_user(instance.user_id, following_count=-1)
+    stats.shift_user(instance.author_id, followers_count=-1)
+    counts.reset(counts.follow_key(instance.user_id))
+    if feeds.release(instance.author_id):
+        counts.reset(*counts.follower_keys(instance.author_id))
+
+
+# pre_delete: после удаления группы её посты уже отвязаны (SET_NULL).
+@receiver((post_save, pre_delete), sender=Group)
+def invalidate_group_tags(sender, instance, raw=False, signal=None,
+                          created=False, **kwargs):
+    if raw:
+        return
+    slugs = {instance.slug, instance._initial_slug} - {None}
+    stale = list(map(tags.group_tag, slugs))
+    # Название и ссылка на группу есть в карточках её постов: в ленте,
+    # в профилях авторов и на страницах самих постов.
+    renamed = (instance.slug, instance.title) != (
+        instance._initial_slug, instance._initial_title)
+    if signal is pre_delete or (renamed and not created):
+        rows = instance.posts.values_list('pk', 'author_id')
+        stale.extend(tags.for_posts(*zip(*rows)))
+    tags.invalidate(*stale)
+    instance._initial_slug = instance.slug
+    instance._initial_title = instance.title
+
+
+@receiver((post_save, post_delete), sender=Comment)
+def invalidate_comment_tags(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tags.invalidate(tags.post_tag(instance.post_id))
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_follow_tags(sender, instance, raw=False, **kwargs):
+    # Счётчики подписок видны в профилях обоих пользователей.
+    if not raw:
+        usernames = User.objects.filter(
+            pk__in=(instance.user_id, instance.author_id)).values_list(
+            'username', flat=True)
+        tags.invalidate(*map(tags.author_tag, usernames))
@@ -0,0 +1,45 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from posts.services import tags as cache_tags
+
+register = template.Library()
+
+
+class TaggedCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, tags, vary_on):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.tags = tags
+        self.vary_on = vary_on
+
+    def render(self, context):
+        timeout = self.timeout.resolve(context)
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        return cache_tags.fetch(key, list(self.tags.resolve(context)),
+                                lambda: self.nodelist.render(context),
+                                timeout)
+
+
+@register.tag('tagged_cache')
+def do_tagged_cache(parser, token):
+    """
+    Как {% cache %}, но фрагмент сбрасывается по тегам и защищён от
+    лавины пересборок (posts.services.tags.fetch):
+
+        {% tagged_cache timeout fragment_name tags [var1 var2 ...] %}
+
+    tags - переменная со списком тегов фрагмента.
+    """
+    nodelist = parser.parse(('endtagged_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 4:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires at least 3 arguments.")
+    return TaggedCacheNode(
+        nodelist, parser.compile_filter(bits[1]), bits[2],
+        parser.compile_filter(bits[3]),
+        [parser.compile_filter(bit) for bit in bits[4:]])
@@ -0,0 +1,59 @@
+import logging
+
+from django import template
+from sorl.thumbnail.conf import settings as thumbnail_settings
+
+from posts.services import resize, thumbnails
+
+register = template.Library()
+
+logger = logging.getLogger(__name__)
+
+
+@register.simple_tag
+def preset_thumbnail(image, preset):
+    """
+    Миниатюра изображения по пресету из THUMBNAIL_PRESETS.
+
+    Страница миниатюры не создаёт: их готовит пул процессов при
+    сохранении поста. Если view уже разрешил миниатюры страницы
+    (thumbnails.prefetch), они берутся из post.thumbnails без запросов.
+    Если миниатюры ещё нет (старый пост), она ставится в очередь,
+    а шаблон пока показывает оригинал. Ошибки, как и в теге sorl,
+    не роняют страницу, если не включён THUMBNAIL_DEBUG.
+    """
+    if not image:
+        return None
+    prefetched = getattr(image.instance, 'thumbnails', None) or {}
+    try:
+        thumbnail = prefetched.get(preset)
+        if thumbnail is None and preset not in prefetched:
+            thumbnail = thumbnails.lookup(image.name, preset)
+        if thumbnail is None:
+            thumbnails.schedule(image.name)
+            thumbnail = thumbnails.lookup(image.name, preset)
+    except Exception:
+        if thumbnail_settings.THUMBNAIL_DEBUG:
+            raise
+        logger.exception('thumbnail lookup failed for %s', image.name)
+        return None
+    return thumbnail
+
+
+@register.simple_tag
+def preset_srcset(image, preset):
+    """
+    Атрибуты srcset и sizes для <img> по ширинам пресета.
+
+    Ссылки ведут на posts:resized_image, так что телефон скачает
+    маленький вариант, а не карточку на 960 пикселей.
+    """
+    if not image:
+        return ''
+    try:
+        return resize.srcset(image.name, preset)
+    except Exception:
+        if thumbnail_settings.THUMBNAIL_DEBUG:
+            raise
+        logger.exception('srcset failed for %s', image.name)
+        return ''
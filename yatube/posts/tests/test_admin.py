@@ -0,0 +1,122 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+from ..services import counts, tags
+
+User = get_user_model()
+
+
+class PostAdminPerformanceTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        cls.groups = [Group.objects.create(slug=f'group-{i}', title=f'{i}')
+                      for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:posts_post_changelist')
+
+    def add_posts(self, number):
+        for i in range(number):
+            author = User.objects.create_user(
+                username=f'author{Post.objects.count()}')
+            Post.objects.create(text=f'Текст {i}', author=author,
+                                group=self.groups[i % 3])
+
+    def test_changelist_cost_does_not_depend_on_rows(self):
+        self.add_posts(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url)
+        self.add_posts(10)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['cl'].result_count, 12)
+        self.assertEqual(len(many), len(few))
+
+    def test_list_edit_is_saved_in_one_update(self):
+        self.add_posts(2)
+        posts = list(Post.objects.order_by('pk'))
+        group_key = counts.group_key(self.groups[2].pk)
+        counts.cached_count(group_key, self.groups[2].posts.all())
+        data = {'form-TOTAL_FORMS': 2, 'form-INITIAL_FORMS': 2,
+                '_save': 'Сохранить'}
+        for i, post in enumerate(posts):
+            data[f'form-{i}-id'] = post.pk
+            data[f'form-{i}-group'] = self.groups[2].pk
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        updates = [query['sql'] for query in captured.captured_queries
+                   if query['sql'].startswith('UPDATE "posts_post"')]
+        self.assertEqual(len(updates), 1)
+        for post in posts:
+            fresh = Post.objects.get(pk=post.pk)
+            self.assertEqual(fresh.group, self.groups[2])
+            self.assertGreater(fresh.updated, post.updated)
+        self.assertIsNone(cache.get(group_key))
+
+    @override_settings(ADMIN_COUNT_ESTIMATE_MIN=1)
+    def test_unfiltered_changelist_uses_estimated_count(self):
+        self.add_posts(3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.add_posts(2)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get(self.url, {'q': 'текст'})
+        self.assertEqual(response.context['cl'].result_count, 5)
+
+    def test_add_post_with_author(self):
+        author = User.objects.create_user(username='writer')
+        response = self.client.post(reverse('admin:posts_post_add'), {
+            'text': 'Из админки', 'author': author.pk,
+            'comments_count': 0})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Post.objects.get(text='Из админки').author, author)
+
+    def test_raw_id_list_editable_does_not_load_all_users(self):
+        self.add_posts(3)
+        Follow.objects.create(user=self.admin, author=User.objects.first())
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(
+                reverse('admin:posts_follow_changelist'))
+        self.assertEqual(response.status_code, 200)
+        full_scans = [query['sql'] for query in captured.captured_queries
+                      if 'FROM "auth_user"' in query['sql']
+                      and 'WHERE' not in query['sql']]
+        self.assertEqual(full_scans, [])
+
+    def test_comment_search_by_text_and_author(self):
+        self.add_posts(1)
+        post = Post.objects.get()
+        comment = Comment.objects.create(post=post, author=self.admin,
+                                         text='Находка в комментарии')
+        url = reverse('admin:posts_comment_changelist')
+        for term in ('Находка', self.admin.username):
+            with self.subTest(term=term):
+                response = self.client.get(url, {'q': term})
+                self.assertEqual(
+                    list(response.context['cl'].result_list), [comment])
+
+    def test_comment_list_edit_invalidates_post_page(self):
+        self.add_posts(1)
+        post = Post.objects.get()
+        comment = Comment.objects.create(post=post, author=self.admin,
+                                         text='Старый')
+        version = tags.version(tags.post_tag(post.pk))
+        response = self.client.post(
+            reverse('admin:posts_comment_changelist'),
+            {'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1,
+             '_save': 'Сохранить', 'form-0-id': comment.pk,
+             'form-0-text': 'Новый'})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotEqual(tags.version(tags.post_tag(post.pk)), version)
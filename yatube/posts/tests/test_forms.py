@@ -1,4 +1,3 @@
-from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
@@ -8,17 +7,25 @@ from http import HTTPStatus
 
 from ..models import Post, Group, Comment
 
+from io import BytesIO
+
+from PIL import Image
+
 import shutil
 import tempfile
 import os
 
 
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# Вне дерева проекта; блокировки миниатюр - там же, а не в MEDIA_ROOT.
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+TEMP_LOCK_DIR = os.path.join(TEMP_MEDIA_ROOT, 'cache', 'locks')
+MEDIA_SETTINGS = {'MEDIA_ROOT': TEMP_MEDIA_ROOT,
+                  'THUMBNAIL_LOCK_DIR': TEMP_LOCK_DIR}
 
 User = get_user_model()
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(**MEDIA_SETTINGS)
 class PostCreateFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -227,3 +234,49 @@ class PostCreateFormTests(TestCase):
                               + reverse('posts:add_comment',
                                         kwargs={'post_id': self.post.id})))
         self.assertEqual(Comment.objects.count(), comment)
+
+
+@override_settings(IMAGE_MASTER_SIZE=100, **MEDIA_SETTINGS)
+class ImageIngestTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Sergei')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def photo(self, size, orientation=None):
+        image = Image.new('RGB', size, 'red')
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        if orientation:
+            exif[0x0112] = orientation
+        output = BytesIO()
+        image.save(output, 'JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile('photo.jpg', output.getvalue(),
+                                  content_type='image/jpeg')
+
+    def create(self, upload):
+        return self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Фото', 'image': upload})
+
+    def test_photo_is_downscaled_rotated_and_stripped(self):
+        # Orientation 6: снимок повёрнут, после поворота он вертикальный.
+        self.create(self.photo((400, 200), orientation=6))
+        post = Post.objects.get()
+        self.assertEqual(os.path.basename(post.image.name), 'photo.jpg')
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.format, 'JPEG')
+            self.assertEqual(stored.size, (50, 100))
+            self.assertFalse(stored.getexif())
+
+    @override_settings(IMAGE_MAX_PIXELS=1000)
+    def test_too_many_pixels_is_rejected(self):
+        response = self.create(self.photo((400, 200)))
+        self.assertFalse(Post.objects.exists())
+        self.assertFormError(response, 'form', 'image',
+                             'Картинка слишком большая: 400×200 пикселей.')
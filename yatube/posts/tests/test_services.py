@@ -0,0 +1,732 @@
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core.cache import SQLiteCache
+
+from ..models import Comment, Follow, Group, Post, Timeline, UserStats
+from ..services import counts, feeds, resize, tags, thumbnails
+from ..services.querysets import feed_queryset
+from .utils import run_on_commit
+
+from io import BytesIO, StringIO
+from unittest import mock
+
+from PIL import Image
+
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+User = get_user_model()
+
+
+def _incr_many(location, times):
+    shared = SQLiteCache(location, {})
+    for _ in range(times):
+        shared.incr('hits')
+
+
+# Вне дерева проекта; блокировки миниатюр - там же, а не в MEDIA_ROOT.
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+TEMP_LOCK_DIR = os.path.join(TEMP_MEDIA_ROOT, 'cache', 'locks')
+MEDIA_SETTINGS = {'MEDIA_ROOT': TEMP_MEDIA_ROOT,
+                  'THUMBNAIL_LOCK_DIR': TEMP_LOCK_DIR}
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+class CountCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Sergei')
+        cls.follower = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(slug='test-group')
+        cls.other_group = Group.objects.create(slug='other-group')
+        Follow.objects.create(user=cls.follower, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.keys = {
+            counts.index_key(): Post.objects.all(),
+            counts.group_key(self.group.pk): self.group.posts.all(),
+            counts.follow_key(self.follower.pk): Post.objects.filter(
+                author__following__user=self.follower),
+        }
+        for key, queryset in self.keys.items():
+            counts.cached_count(key, queryset)
+
+    def assertCountsMatch(self):
+        for key, queryset in self.keys.items():
+            with self.subTest(key=key):
+                self.assertEqual(cache.get(key), queryset.count())
+
+    def test_create_and_delete_shift_counts(self):
+        """Создание и удаление поста сдвигают счётчики всех его лент."""
+        post = Post.objects.create(text='Текст', author=self.author,
+                                   group=self.group)
+        self.assertCountsMatch()
+        post.delete()
+        self.assertCountsMatch()
+
+    def test_group_change_moves_count(self):
+        post = Post.objects.create(text='Текст', author=self.author,
+                                   group=self.group)
+        counts.cached_count(counts.group_key(self.other_group.pk),
+                            self.other_group.posts.all())
+        post.group = self.other_group
+        post.save()
+        self.assertEqual(cache.get(counts.group_key(self.group.pk)), 0)
+        self.assertEqual(cache.get(counts.group_key(self.other_group.pk)), 1)
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_profile_renders_without_count_query(self):
+        Post.objects.create(text='Текст', author=self.author)
+        url = reverse('posts:profile', kwargs={'username': 'Sergei'})
+        self.guest_client.get(url)
+        with self.assertNumQueries(2):
+            response = self.guest_client.get(url)
+        self.assertEqual(response.context['number_of_posts'], 1)
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Sergei')
+        cls.reader = User.objects.create_user(username='Reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_writes_shift_counters(self):
+        post = Post.objects.create(text='Текст', author=self.author)
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_reconcile_command_fixes_drift(self):
+        post = Post.objects.create(text='Текст', author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('пользователей 2, постов 1', out.getvalue())
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_post_detail_reads_counters(self):
+        post = Post.objects.create(text='Текст', author=self.author)
+        UserStats.objects.filter(user=self.author).update(posts_count=5)
+        response = Client().get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertEqual(response.context['post_count'], 5)
+
+
+class TagInvalidationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Sergei')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(slug='test-group')
+        cls.other_group = Group.objects.create(slug='other-group')
+
+    def setUp(self):
+        cache.clear()
+
+    def remember(self, *tag_names):
+        return {tag: tags.version(tag) for tag in tag_names}
+
+    def assertInvalidated(self, remembered, expected):
+        changed = {tag for tag, version in remembered.items()
+                   if tags.version(tag) != version}
+        self.assertEqual(changed, set(expected))
+
+    def test_cached_value_lives_until_its_tag_is_invalidated(self):
+        compute = mock.Mock(side_effect=['первый', 'второй'])
+        for _ in range(2):
+            value = tags.fetch('key', ['group:a', 'author:b'], compute)
+        self.assertEqual((value, compute.call_count), ('первый', 1))
+        tags.invalidate('author:b')
+        self.assertEqual(tags.fetch('key', ['group:a', 'author:b'],
+                                    compute), 'второй')
+
+    def test_post_writes_invalidate_its_pages(self):
+        remembered = self.remember(
+            tags.INDEX, 'group:test-group', 'group:other-group',
+            'author:Sergei', 'author:Reader')
+        post = Post.objects.create(text='Текст', author=self.author,
+                                   group=self.group)
+        self.assertInvalidated(remembered, [
+            tags.INDEX, 'group:test-group', 'author:Sergei'])
+        remembered = self.remember(*remembered, f'post:{post.pk}')
+        post.group = self.other_group
+        post.save()
+        self.assertInvalidated(remembered, [
+            tags.INDEX, 'group:test-group', 'group:other-group',
+            'author:Sergei', f'post:{post.pk}'])
+
+    def test_comment_group_and_follow_writes(self):
+        post = Post.objects.create(text='Текст', author=self.author)
+        remembered = self.remember(f'post:{post.pk}', tags.INDEX,
+                                   'author:Sergei', 'author:Reader')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        self.assertInvalidated(remembered, [f'post:{post.pk}'])
+        remembered = self.remember(*remembered)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertInvalidated(remembered, ['author:Sergei', 'author:Reader'])
+        group = Group.objects.create(slug='old-slug')
+        remembered = self.remember('group:old-slug', 'group:renamed')
+        group.slug = 'renamed'
+        group.save()
+        self.assertInvalidated(remembered, ['group:old-slug', 'group:renamed'])
+
+    def test_group_rename_invalidates_its_posts_pages(self):
+        post = Post.objects.create(text='Текст', author=self.author,
+                                   group=self.group)
+        remembered = self.remember(tags.INDEX, f'post:{post.pk}',
+                                   'author:Sergei', 'author:Reader')
+        group = Group.objects.get(pk=self.group.pk)
+        group.description = 'Описание'
+        group.save()
+        self.assertInvalidated(remembered, [])
+        group.title = 'Новое название'
+        group.save()
+        self.assertInvalidated(remembered, [
+            tags.INDEX, f'post:{post.pk}', 'author:Sergei'])
+        remembered = self.remember(*remembered)
+        group.delete()
+        self.assertInvalidated(remembered, [
+            tags.INDEX, f'post:{post.pk}', 'author:Sergei'])
+
+    def test_page_built_before_commit_is_invalidated_after_it(self):
+        with run_on_commit():
+            with transaction.atomic():
+                Post.objects.create(text='Текст', author=self.author)
+                # Параллельный запрос собрал страницу до коммита.
+                tags.fetch('page', [tags.INDEX], lambda: 'до коммита')
+        self.assertEqual(tags.fetch('page', [tags.INDEX],
+                                    lambda: 'после коммита'),
+                         'после коммита')
+
+
+class StampedeTests(SimpleTestCase):
+    tag_names = ['listing:index']
+
+    def setUp(self):
+        cache.clear()
+        self.compute = mock.Mock(return_value='новое')
+
+    def put(self, value, expires=None, delta=0.0):
+        versions = tags.versions(self.tag_names)
+        cache.set('key', (versions, value, expires, delta))
+
+    def fetch(self):
+        return tags.fetch('key', self.tag_names, self.compute, timeout=60)
+
+    def test_stale_copy_is_served_while_another_worker_rebuilds(self):
+        self.put('старое')
+        tags.invalidate(*self.tag_names)
+        cache.add('key:lock', 1)
+        self.assertEqual(self.fetch(), 'старое')
+        self.compute.assert_not_called()
+        cache.delete('key:lock')
+        self.assertEqual(self.fetch(), 'новое')
+        self.assertEqual(self.fetch(), 'новое')
+        self.compute.assert_called_once()
+
+    def test_entry_is_rebuilt_early_with_growing_probability(self):
+        self.put('старое', expires=time.time() + 5, delta=1.0)
+        with mock.patch('random.random', return_value=0.0):
+            self.assertEqual(self.fetch(), 'старое')
+        # -log(1 - 0.999) * 1.0 ≈ 6.9 с - уже за сроком записи.
+        with mock.patch('random.random', return_value=0.999):
+            self.assertEqual(self.fetch(), 'новое')
+
+    def test_cold_miss_waits_for_lock_holder(self):
+        cache.add('key:lock', 1)
+        versions = tags.versions(self.tag_names)
+        timer = threading.Timer(0.1, cache.set, (
+            'key', (versions, 'от соседа', None, 0.0)))
+        timer.start()
+        self.assertEqual(self.fetch(), 'от соседа')
+        timer.join()
+        self.compute.assert_not_called()
+
+    @override_settings(CACHE_LOCK_WAIT=5)
+    def test_cold_miss_stops_waiting_when_lock_is_released_empty(self):
+        # Держатель не сохранил результат (404, некэшируемый ответ).
+        cache.add('key:lock', 1)
+        timer = threading.Timer(0.1, cache.delete, ('key:lock',))
+        timer.start()
+        started = time.monotonic()
+        self.assertEqual(self.fetch(), 'новое')
+        timer.join()
+        self.assertLess(time.monotonic() - started, 1)
+        self.compute.assert_called_once()
+
+    def test_concurrent_misses_are_coalesced(self):
+        def compute():
+            time.sleep(0.2)
+            return ['страница']
+        self.compute.side_effect = compute
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.fetch())) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [['страница']] * 5)
+        self.compute.assert_called_once()
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Sergei')
+        cls.follower = User.objects.create_user(username='Reader')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.follower)
+
+    def timeline(self):
+        return list(self.follower.timeline.values_list('post_id', flat=True))
+
+    def test_new_post_is_pushed_to_followers(self):
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(text='Текст', author=self.author)
+        self.assertEqual(self.timeline(), [post.pk])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        post = Post.objects.create(text='Текст', author=self.author)
+        follow = Follow.objects.create(user=self.follower, author=self.author)
+        self.assertEqual(self.timeline(), [post.pk])
+        follow.delete()
+        self.assertEqual(self.timeline(), [])
+
+    def test_follow_index_reads_timeline(self):
+        Follow.objects.create(user=self.follower, author=self.author)
+        posts = [Post.objects.create(text=f'Текст {i}', author=self.author)
+                 for i in range(3)]
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual([post.pk for post in response.context['page_obj']],
+                         [post.pk for post in reversed(posts)])
+
+    def test_rebuild_command_repairs_timeline(self):
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(text='Текст', author=self.author)
+        self.follower.timeline.all().delete()
+        call_command('rebuild_timelines', 'Reader', stdout=StringIO())
+        self.assertEqual(self.timeline(), [post.pk])
+
+    @override_settings(FEED_PULL_THRESHOLD=1)
+    def test_hybrid_feed_merges_push_and_pull(self):
+        """Посты популярного автора подтягиваются при чтении ленты."""
+        star = User.objects.create_user(username='Star')
+        fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=fan, author=star)
+        Follow.objects.create(user=self.follower, author=star)
+        Follow.objects.create(user=self.follower, author=self.author)
+        cache.clear()
+        posts = [
+            Post.objects.create(text='Текст', author=author)
+            for author in (self.author, star, self.author, star)
+        ]
+        self.assertEqual(self.timeline(), [posts[2].pk, posts[0].pk])
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual([post.pk for post in response.context['page_obj']],
+                         [post.pk for post in reversed(posts)])
+        self.assertEqual(response.context['feed_stats'],
+                         {'push': 2, 'pull': 2})
+
+    @override_settings(FEED_PULL_THRESHOLD=1)
+    def test_pulled_post_skips_follower_counters(self):
+        star = User.objects.create_user(username='Star')
+        fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=fan, author=star)
+        Follow.objects.create(user=self.follower, author=star)
+        cache.clear()
+        key = counts.follow_key(fan.pk)
+        cache.set(key, 0)
+        with mock.patch.object(counts, 'follower_keys') as follower_keys:
+            Post.objects.create(text='Текст', author=star)
+        follower_keys.assert_not_called()
+        self.assertEqual(cache.get(key), 0)
+        self.client.force_login(fan)
+        response = self.client.get(reverse('posts:follow_index'),
+                                   {'page': 1})
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+
+    @override_settings(FEED_PULL_THRESHOLD=1)
+    def test_author_leaving_pull_gets_posts_pushed(self):
+        star = User.objects.create_user(username='Star')
+        fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=fan, author=star)
+        Follow.objects.create(user=self.follower, author=star)
+        cache.clear()
+        post = Post.objects.create(text='Текст', author=star)
+        self.assertEqual(self.timeline(), [])
+        # Кэш множества pull-авторов успел истечь к моменту отписки.
+        cache.delete(feeds.PULLED_KEY)
+        Follow.objects.get(user=fan, author=star).delete()
+        self.assertNotIn(star.pk, feeds.pulled_authors())
+        self.assertEqual(self.timeline(), [post.pk])
+
+
+class FeedQuerysetTests(TestCase):
+    def test_comment_count_annotation(self):
+        author = User.objects.create_user(username='Sergei')
+        post = Post.objects.create(text='Текст', author=author)
+        Comment.objects.create(post=post, author=author, text='Первый')
+        Comment.objects.create(post=post, author=author, text='Второй')
+        with self.assertNumQueries(1):
+            post = feed_queryset(with_comment_count=True).get()
+            self.assertEqual(post.comment_count, 2)
+            self.assertEqual(post.author.username, 'Sergei')
+
+
+@override_settings(**MEDIA_SETTINGS)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Sergei')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def upload(self, name='small.gif'):
+        return SimpleUploadedFile(name, SMALL_GIF, content_type='image/gif')
+
+    def test_thumbnail_is_ready_after_create(self):
+        self.client.post(reverse('posts:post_create'),
+                         {'text': 'Текст', 'image': self.upload()})
+        post = Post.objects.get()
+        thumbnail = thumbnails.lookup(post.image.name, 'card')
+        self.assertIsNotNone(thumbnail)
+        with mock.patch.object(thumbnails, 'generate') as generate:
+            response = self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        generate.assert_not_called()
+        self.assertContains(response, thumbnail.url)
+
+    def test_thumbnail_is_generated_once(self):
+        post = Post.objects.create(text='Текст', author=self.author,
+                                   image=self.upload('once.gif'))
+        get_image = thumbnails.default.engine.get_image
+        with mock.patch.object(thumbnails.default.engine, 'get_image',
+                               side_effect=get_image) as decode:
+            thumbnails.generate(post.image.name)
+            thumbnails.generate(post.image.name)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_failed_generation_does_not_invalidate_pages(self):
+        post = Post.objects.create(text='Текст', author=self.author,
+                                   image='posts/missing.gif')
+        updated = post.updated
+        version = tags.version(tags.INDEX)
+        generate = mock.Mock(wraps=thumbnails.generate)
+        with mock.patch.object(thumbnails, 'generate', generate), \
+                self.assertLogs('sorl.thumbnail', 'ERROR'):
+            for _ in range(2):
+                self.client.get(reverse('posts:post_detail',
+                                        kwargs={'post_id': post.pk}))
+        self.assertEqual(generate.call_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.updated, updated)
+        self.assertEqual(tags.version(tags.INDEX), version)
+
+    @override_settings(THUMBNAIL_SYNC=False)
+    def test_broken_pool_does_not_fail_post_create(self):
+        pool = mock.Mock()
+        pool.submit.side_effect = thumbnails.BrokenProcessPool()
+        with mock.patch.object(thumbnails, '_pool', pool), \
+                self.assertLogs('posts.services.thumbnails', 'ERROR'):
+            response = self.client.post(
+                reverse('posts:post_create'),
+                {'text': 'Текст', 'image': self.upload('broken.gif')})
+            self.assertIsNone(thumbnails._pool)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Post.objects.filter(text='Текст').exists())
+        pool.shutdown.assert_called_once_with(wait=False)
+
+    def test_listing_resolves_thumbnails_in_one_query(self):
+        posts = [Post.objects.create(text='Текст', author=self.author,
+                                     image=self.upload(f'{i}.gif'))
+                 for i in range(3)]
+        for post in posts:
+            thumbnails.generate(post.image.name)
+        cache.clear()
+        with self.assertNumQueries(1):
+            thumbnails.prefetch(posts)
+        with self.assertNumQueries(0):
+            thumbnails.prefetch(posts)
+        self.assertEqual(posts[0].thumbnails['card'].url,
+                         thumbnails.lookup(posts[0].image.name, 'card').url)
+        out = StringIO()
+        call_command('benchmark_thumbnails', repeat=2, stdout=out)
+        self.assertRegex(out.getvalue(), r'cold  per-tag .* queries 3')
+        self.assertRegex(out.getvalue(), r'cold  batched .* queries 1')
+
+
+@override_settings(**MEDIA_SETTINGS)
+class ResizeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        author = User.objects.create_user(username='Sergei')
+        output = BytesIO()
+        Image.new('RGB', (1200, 600), 'blue').save(output, 'JPEG')
+        cls.post = Post.objects.create(
+            text='Текст', author=author,
+            image=SimpleUploadedFile('photo.jpg', output.getvalue()))
+        cls.name = cls.post.image.name
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def get(self, width, accept='image/webp,*/*'):
+        return self.client.get(resize.url(self.name, 'card', width),
+                               HTTP_ACCEPT=accept)
+
+    def test_card_has_srcset(self):
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        self.assertContains(response, resize.url(self.name, 'card', 320))
+        self.assertContains(response, 'sizes="')
+
+    def test_variant_format_follows_accept(self):
+        response = self.get(320)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('Accept', response['Vary'])
+        image = Image.open(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual((image.format, image.size), ('WEBP', (320, 113)))
+        response = self.get(320, accept='image/webp;q=0, image/*')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_variant_is_resized_once(self):
+        get_image = thumbnails.default.engine.get_image
+        with mock.patch.object(thumbnails.default.engine, 'get_image',
+                               side_effect=get_image) as decode:
+            self.get(640)
+            self.get(640)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_unsigned_or_unknown_width_is_rejected(self):
+        url = resize.url(self.name, 'card', 320)
+        self.assertEqual(self.client.get(url.replace('/320/', '/321/'))
+                         .status_code, 404)
+        self.assertEqual(self.client.get(url.replace(self.name, 'other.jpg'))
+                         .status_code, 404)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_basic_operations(self):
+        self.cache.set('post', {'text': 'Текст'})
+        self.cache.set_many({'a': 1, 'b': True})
+        self.assertEqual(self.cache.get('post'), {'text': 'Текст'})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'missing']),
+                         {'a': 1, 'b': True})
+        self.assertFalse(self.cache.add('a', 2))
+        self.assertTrue(self.cache.add('c', 3))
+        self.assertEqual(self.cache.incr('a', 10), 11)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.incr_many(['a', 'b', 'c', 'missing'], -1)
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c', 'missing']),
+                         {'a': 10, 'b': True, 'c': 2})
+        self.cache.delete_many(['a', 'c'])
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_expired_entries_are_missing(self):
+        with mock.patch('time.time', return_value=1000.0):
+            self.cache.set('key', 'value', timeout=10)
+        with mock.patch('time.time', return_value=1011.0):
+            self.assertIsNone(self.cache.get('key'))
+            self.assertTrue(self.cache.add('key', 'new'))
+            self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_processes_share_cache_and_incr_is_atomic(self):
+        self.cache.set('hits', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_incr_many,
+                                   args=(self.location, 50))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('hits'), 200)
+
+
+class BenchmarkCommandsTests(TestCase):
+    def test_generate_dataset_is_deterministic_and_benchmarked(self):
+        options = {'users': 5, 'groups': 2, 'posts': 30, 'comments': 5,
+                   'follows': 2, 'stdout': StringIO()}
+        call_command('generate_dataset', **options)
+        texts = list(Post.objects.order_by('pk').values_list('text',
+                                                             flat=True))
+        self.assertEqual(len(texts), 30)
+        self.assertEqual(Follow.objects.count(), 10)
+        self.assertEqual(Timeline.objects.count(), Post.objects.filter(
+            author__following__isnull=False).count())
+        Post.objects.all().delete()
+        call_command('generate_dataset', **options)
+        self.assertEqual(list(Post.objects.order_by('pk').values_list(
+            'text', flat=True)), texts)
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('benchmark_views', repeat=3, warmup=0,
+                         output=output.name, stdout=StringIO())
+            report = json.load(output)
+        self.assertEqual(set(report['views']), {
+            'index', 'index_deep_page', 'post_detail', 'profile',
+            'group_list', 'follow_index'})
+        self.assertLessEqual(report['views']['index']['p50_ms'],
+                             report['views']['index']['p99_ms'])
+
+
+class ImportDumpTests(TestCase):
+    def setUp(self):
+        # Существующий пользователь сопоставляется по username, а pk
+        # из архива уже заняты - связи должны идти через карту pk.
+        self.existing = User.objects.create_user(username='leo')
+        Group.objects.create(title='Старая', slug='old', description='-')
+        records = [
+            {'model': 'auth.user', 'pk': 1,
+             'fields': {'username': 'leo', 'password': '!'}},
+            {'model': 'auth.user', 'pk': 2,
+             'fields': {'username': 'ann', 'password': '!'}},
+            {'model': 'posts.group', 'pk': 1,
+             'fields': {'title': 'Новая', 'slug': 'new',
+                        'description': '-'}},
+            {'model': 'posts.post', 'pk': 5,
+             'fields': {'text': 'Из архива', 'author': 2, 'group': 1,
+                        'pub_date': '2020-01-02T03:04:05Z'}},
+            {'model': 'posts.post', 'pk': 6,
+             'fields': {'text': 'Без автора', 'author': 99}},
+            {'model': 'posts.comment', 'pk': 1,
+             'fields': {'post': 5, 'author': 1, 'text': 'Ответ',
+                        'created': '2020-01-03T00:00:00Z'}},
+            {'model': 'posts.follow', 'pk': 1,
+             'fields': {'user': 1, 'author': 2}},
+            {'model': 'posts.follow', 'pk': 2,
+             'fields': {'user': 1, 'author': 2}},
+            {'model': 'sessions.session', 'pk': 'x', 'fields': {}},
+        ]
+        self.ndjson = '\n'.join(map(json.dumps, records))
+        self.array = json.dumps(records, indent=2)
+
+    def run_import(self, content, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as dump:
+            dump.write(content)
+            dump.flush()
+            call_command('import_dump', dump.name, stdout=StringIO(),
+                         **options)
+
+    def check_imported(self):
+        ann = User.objects.get(username='ann')
+        post = Post.objects.get(text='Из архива')
+        self.assertEqual(post.author, ann)
+        self.assertEqual(post.group.slug, 'new')
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.updated, post.pub_date)
+        self.assertFalse(Post.objects.filter(text='Без автора').exists())
+        comment = Comment.objects.get()
+        self.assertEqual((comment.post, comment.author),
+                         (post, self.existing))
+        self.assertEqual(comment.created.day, 3)
+        self.assertTrue(Follow.objects.filter(
+            user=self.existing, author=ann).exists())
+        self.assertEqual(Follow.objects.count(), 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(UserStats.objects.get(user=ann).followers_count, 1)
+        self.assertTrue(Timeline.objects.filter(
+            user=self.existing, post=post).exists())
+
+    def test_ndjson_in_small_batches_and_chunks(self):
+        self.run_import(self.ndjson, batch_size=1, chunk_size=2)
+        self.check_imported()
+
+    def test_json_array_read_in_small_pieces(self):
+        with mock.patch('posts.services.importer.READ_SIZE', 7):
+            self.run_import(self.array)
+        self.check_imported()
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Group.objects.count(), 2)
+
+    def test_sequences_are_reset_after_import(self):
+        # На SQLite сбрасывать нечего, но PostgreSQL без этого выдаст
+        # следующему посту pk, занятый импортом.
+        ops = connection.ops
+        with mock.patch.object(ops, 'sequence_reset_sql',
+                               return_value=[]) as reset:
+            self.run_import(self.ndjson)
+        reset.assert_called_once()
+        self.assertEqual(set(reset.call_args[0][1]),
+                         {User, Group, Post, Comment, Follow})
+        post = Post.objects.create(text='После импорта', author=self.existing)
+        self.assertGreater(post.pk, Post.objects.exclude(
+            pk=post.pk).aggregate(top=Max('pk'))['top'])
@@ -1,11 +1,17 @@
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils.http import urlsafe_base64_encode
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django import forms
 
-from ..models import Follow, Group, Post
+from core.instrumentation import QueryBudgetExceeded
+
+from ..models import Comment, Follow, Group, Post
+from ..services.stats import reconcile_users
 
 from collections.abc import Iterable
 
@@ -13,16 +19,31 @@ from http import HTTPStatus
 
 from typing import Iterable
 
+import json
 import math
+import os
+import re
+import shutil
+import tempfile
 
 
 User = get_user_model()
 
 PAG_FIRST_PAGE = 10
 
+# Полный проход по таблице или сортировка во временном B-дереве.
+BAD_PLAN = re.compile(r'^SCAN (TABLE )?\w+( AS \w+)?$|TEMP B-TREE')
+
 FOUND = HTTPStatus.FOUND
 
+# Вне дерева проекта; блокировки миниатюр - там же, а не в MEDIA_ROOT.
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+TEMP_LOCK_DIR = os.path.join(TEMP_MEDIA_ROOT, 'cache', 'locks')
+MEDIA_SETTINGS = {'MEDIA_ROOT': TEMP_MEDIA_ROOT,
+                  'THUMBNAIL_LOCK_DIR': TEMP_LOCK_DIR}
+
 
+@override_settings(**MEDIA_SETTINGS)
 class PostPagesTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -49,6 +70,11 @@ class PostPagesTests(TestCase):
             image=uploaded
         )
 
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
     def setUp(self):
         self.guest_client = Client()
         self.user = User.objects.get(username='Sergei')
@@ -162,6 +188,36 @@ class PostPagesTests(TestCase):
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertNotIn(self.post.text, response.content.decode('utf-8'))
 
+    def test_cache_index_new_post_shown_at_once(self):
+        """Новый пост сбрасывает поколение кэша главной страницы."""
+        self.authorized_client.get(reverse('posts:index'))
+        post = Post.objects.create(text='Свежий пост', author=self.author)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertIn(post.text, response.content.decode('utf-8'))
+
+    def test_post_card_cache_follows_post_and_author(self):
+        """Карточка поста перерисовывается при правке поста и автора."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.guest_client.get(url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный текст'
+        post.save()
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Сергей'
+        author.save()
+        content = self.guest_client.get(url).content.decode('utf-8')
+        self.assertIn('Исправленный текст', content)
+        self.assertIn('Сергей', content)
+
+    def test_cache_index_varies_on_page(self):
+        Post.objects.bulk_create(
+            Post(text=f'Старый пост {i}', author=self.author)
+            for i in range(PAG_FIRST_PAGE))
+        first = self.guest_client.get(reverse('posts:index'))
+        second = self.guest_client.get(reverse('posts:index'),
+                                       {'page': 2})
+        self.assertNotEqual(first.content, second.content)
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -174,8 +230,11 @@ class PaginatorViewsTest(TestCase):
                               group=Group.objects.get(slug='test-group')
                               ) for i in range(0, 14)]
         Post.objects.bulk_create(cls.list_post)
+        reconcile_users()
 
     def setUp(self):
+        # bulk_create обходит сигналы, счётчики лент пересчитаются заново
+        cache.clear()
         self.guest_client = Client()
         self.user = User.objects.create_user(username='StasBasov')
         self.authorized_client = Client()
@@ -229,6 +288,51 @@ class PaginatorViewsTest(TestCase):
         self.assertEqual(len(response.context['page_obj']),
                          self._pages_obj_count(page_number))
 
+    def test_cursor_pages_walk_whole_listing(self):
+        """Токены after/before проходят ленту без пропусков и повторов."""
+        response = self.guest_client.get(reverse('posts:index'))
+        first_page = response.context['page_obj']
+        self.assertEqual(len(first_page), PAG_FIRST_PAGE)
+        self.assertFalse(first_page.has_previous())
+        response = self.guest_client.get(reverse('posts:index'),
+                                         {'after': first_page.next_cursor})
+        second_page = response.context['page_obj']
+        self.assertEqual(second_page.number, 2)
+        self.assertFalse(second_page.has_next())
+        seen = [post.pk for post in first_page] + [
+            post.pk for post in second_page]
+        self.assertEqual(seen, list(Post.objects.order_by(
+            '-pub_date', '-pk').values_list('pk', flat=True)))
+        response = self.guest_client.get(
+            reverse('posts:index'), {'before': second_page.previous_cursor})
+        self.assertEqual([post.pk for post in response.context['page_obj']],
+                         [post.pk for post in first_page])
+
+    def test_cursor_broken_token_returns_first_page(self):
+        response = self.guest_client.get(reverse('posts:index'),
+                                         {'after': 'broken'})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response.context['page_obj'].number, 1)
+
+    def test_cursor_with_wrong_values_returns_first_page(self):
+        tokens = ([{}, 1, 1], [1.5, 1, 1], ['abc', 1, 1],
+                  ['2020-13-45T00:00:00', 1, 1], [None, 1, 1],
+                  ['2020-01-01T00:00:00+00:00', 10 ** 30, 1],
+                  ['2020-01-01T00:00:00+00:00', 1.5, 1],
+                  ['2020-01-01T00:00:00+00:00', 1, -1],
+                  {'a': 1, 'b': 2, 'c': 3})
+        post = Post.objects.first()
+        urls = (reverse('posts:index'),
+                reverse('posts:post_comments', kwargs={'post_id': post.pk}),
+                reverse('posts:search') + '?q=text')
+        for raw in tokens:
+            token = urlsafe_base64_encode(json.dumps(raw).encode())
+            for url in urls:
+                for name in ('after', 'before'):
+                    with self.subTest(raw=raw, url=url, name=name):
+                        response = self.guest_client.get(url, {name: token})
+                        self.assertEqual(response.status_code, HTTPStatus.OK)
+
 
 class SubscriptionTests(TestCase):
     @classmethod
@@ -274,7 +378,7 @@ class SubscriptionTests(TestCase):
                               author=self.user)
         response = self.another_client.get(reverse('posts:follow_index'))
         post_text = post.text
-        self.assertEqual(response.context['posts'].first().text, post_text)
+        self.assertEqual(response.context['page_obj'][0].text, post_text)
 
     def test_post_after_unsub(self):
         """ Проверка что не вижу пост пользователя на которого подписался"""
@@ -287,4 +391,460 @@ class SubscriptionTests(TestCase):
                               author=self.user)
         self._test_subscr('posts:profile_unfollow')
         response = self.another_client.get(reverse('posts:follow_index'))
-        self.assertNotEqual(response.context['posts'].first(), post)
+        self.assertNotIn(post, response.context['page_obj'])
+
+
+class ListingQueryCountTests(TestCase):
+    """Число запросов лент не зависит от числа постов на странице."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(slug='test-group')
+        for i in range(PAG_FIRST_PAGE):
+            author = User.objects.create_user(username=f'Author{i}')
+            Follow.objects.create(user=cls.reader, author=author)
+            Post.objects.create(text=f'Текст {i}', author=author,
+                                group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def assertListingQueries(self, client, url, num):
+        with self.assertNumQueries(num):
+            response = client.get(url)
+        self.assertEqual(len(response.context['page_obj']), PAG_FIRST_PAGE)
+
+    def test_index_queries(self):
+        self.assertListingQueries(self.guest_client,
+                                  reverse('posts:index'), 1)
+
+    def test_group_queries(self):
+        self.assertListingQueries(
+            self.guest_client,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}), 2)
+
+    def test_profile_queries(self):
+        Post.objects.bulk_create(
+            Post(text=f'Текст {i}', author=self.reader, group=self.group)
+            for i in range(PAG_FIRST_PAGE))
+        reconcile_users()
+        self.assertListingQueries(
+            self.guest_client,
+            reverse('posts:profile', kwargs={'username': 'Reader'}), 2)
+
+    def test_follow_index_queries(self):
+        self.assertListingQueries(self.authorized_client,
+                                  reverse('posts:follow_index'), 6)
+
+
+class QueryInstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_server_timing_header(self):
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="1 queries, 0 duplicate", '
+                         r'cache;desc="\d+ hit, \d+ miss"$')
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0})
+    def test_query_budget_exceeded_raises_under_tests(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.guest_client.get(reverse('posts:index'))
+
+
+@override_settings(COMMENTS_NUMBER=3)
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Sergei')
+        cls.post = Post.objects.create(text='Текст', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.url = reverse('posts:post_detail',
+                           kwargs={'post_id': self.post.pk})
+
+    def add_comments(self, number):
+        start = self.post.comments.count()
+        for i in range(start, start + number):
+            author = User.objects.create_user(username=f'Reader{i}')
+            Comment.objects.create(post=self.post, author=author,
+                                   text=f'Комментарий {i}')
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_detail_cost_does_not_depend_on_comments(self):
+        self.add_comments(1)
+        self.guest_client.get(self.url)
+        with CaptureQueriesContext(connection) as few:
+            self.guest_client.get(self.url)
+        self.add_comments(9)
+        self.guest_client.get(self.url)
+        with CaptureQueriesContext(connection) as many:
+            response = self.guest_client.get(self.url)
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(len(response.context['comments']), 3)
+        self.assertIsNotNone(response.context['next_cursor'])
+
+    def test_load_more_fragment_pages_through_comments(self):
+        self.add_comments(7)
+        response = self.guest_client.get(self.url)
+        texts = [comment.text for comment in response.context['comments']]
+        cursor = response.context['next_cursor']
+        while cursor:
+            response = self.guest_client.get(
+                reverse('posts:post_comments',
+                        kwargs={'post_id': self.post.pk}),
+                {'after': cursor})
+            self.assertNotIn('<html', response.content.decode())
+            texts.extend(comment.text
+                         for comment in response.context['comments'])
+            cursor = response.context['next_cursor']
+        self.assertEqual(texts, [f'Комментарий {i}' for i in range(7)])
+
+
+@override_settings(PAGES_NUMBER=2)
+class SearchViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Sergei')
+        cls.other = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(slug='test-group', title='Группа')
+        cls.best = Post.objects.create(
+            text='Кэш кэш кэш', author=cls.author, group=cls.group)
+        cls.worse = Post.objects.create(
+            text='Про кэш и ещё очень много других слов в этом посте',
+            author=cls.other)
+        cls.third = Post.objects.create(
+            text='Кэширование <b>страниц</b>', author=cls.author)
+        Post.objects.create(text='Совсем про другое', author=cls.author)
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, **params):
+        response = self.guest_client.get(reverse('posts:search'), params)
+        return response, [post.pk for post in response.context['page_obj']]
+
+    def test_tied_ranks_page_backwards(self):
+        tied = [Post.objects.create(text='альфа бета', author=self.author).pk
+                for _ in range(5)]
+        pages, after = [], None
+        while True:
+            params = {'q': 'альфа'}
+            if after:
+                params['after'] = after
+            response, page = self.search(**params)
+            pages.append(page)
+            after = response.context['page_obj'].next_cursor
+            if not after:
+                break
+        self.assertEqual(pages, [tied[0:2], tied[2:4], tied[4:]])
+        before = response.context['page_obj'].previous_cursor
+        self.assertEqual(self.search(q='альфа', before=before)[1],
+                         tied[2:4])
+
+    def test_ranked_by_bm25_and_paginated(self):
+        response, first = self.search(q='кэш')
+        # Префиксный поиск: «кэш» находит и «кэширование».
+        self.assertEqual(first, [self.best.pk, self.third.pk])
+        after = response.context['page_obj'].next_cursor
+        self.assertIn('?q=%D0%BA%D1%8D%D1%88&after=',
+                      response.content.decode())
+        response, second = self.search(q='кэш', after=after)
+        self.assertEqual(second, [self.worse.pk])
+
+    def test_filters_by_group_and_author(self):
+        self.assertEqual(self.search(q='кэш', group='test-group')[1],
+                         [self.best.pk])
+        self.assertEqual(self.search(q='кэш', author='Reader')[1],
+                         [self.worse.pk])
+
+    def test_snippet_is_highlighted_and_escaped(self):
+        response, _ = self.search(q='кэширование')
+        content = response.content.decode()
+        self.assertIn('<mark>Кэширование</mark> &lt;b&gt;', content)
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.create(text='Уникальное слово',
+                                   author=self.author)
+        self.assertEqual(self.search(q='уникальное')[1], [post.pk])
+        post.text = 'Другой текст'
+        post.save()
+        self.assertEqual(self.search(q='уникальное')[1], [])
+        self.assertEqual(self.search(q='другой')[1], [post.pk])
+        post.delete()
+        self.assertEqual(self.search(q='другой')[1], [])
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.guest_client.force_login(admin)
+        response = self.guest_client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'кэш'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertNotIn('LIKE', str(response.context['cl'].queryset.query))
+
+
+class QueryPlanTests(TestCase):
+    """Горячие запросы страниц идут по индексам, без сканов и сортировок."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Sergei')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(slug='test-group')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(text='Текст', author=cls.author,
+                                       group=cls.group)
+        Comment.objects.create(post=cls.post, author=cls.reader,
+                               text='Комментарий')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def assertIndexedPlans(self, url, allowed=()):
+        """EXPLAIN QUERY PLAN для каждого SELECT, выполненного страницей."""
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN есть только в SQLite')
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(url)
+        selects = [query['sql'] for query in captured.captured_queries
+                   if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+            with self.subTest(sql=sql):
+                self.assertFalse(
+                    [step for step in plan
+                     if BAD_PLAN.search(step) and step not in allowed], plan)
+
+    def test_listing_plans(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:index') + '?page=1',
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'Sergei'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertIndexedPlans(url)
+
+    def test_search_plan(self):
+        # Совпадения FTS5 сортируются по рангу в любом случае; id как
+        # второй ключ лишь выносит эту сортировку из виртуальной таблицы.
+        self.assertIndexedPlans(reverse('posts:search') + '?q=текст',
+                                allowed=('USE TEMP B-TREE FOR ORDER BY',))
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Sergei')
+        cls.group = Group.objects.create(slug='test-group')
+        cls.post = Post.objects.create(text='Текст', author=cls.author,
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'test-group'}),
+            reverse('posts:profile', kwargs={'username': 'Sergei'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+
+    def revalidate(self, url, client=None):
+        client = client or self.client
+        etag = client.get(url)['ETag']
+        return client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_are_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.revalidate(url)
+                self.assertEqual(response.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                self.assertFalse(response.content)
+
+    def test_not_modified_skips_rendering(self):
+        index, _, profile, detail = self.urls
+        for url, queries in ((index, 0), (profile, 1), (detail, 1)):
+            etag = self.client.get(url)['ETag']
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_changes_produce_new_etag(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        Post.objects.create(text='Новый', author=self.author,
+                            group=self.group)
+        Comment.objects.create(post=self.post, author=self.author,
+                               text='Комментарий')
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_comment_edit_and_author_rename_produce_new_etag(self):
+        comment = Comment.objects.create(post=self.post, author=self.author,
+                                         text='Комментарий')
+        detail = self.urls[3]
+        etag = self.client.get(detail)['ETag']
+        comment.text = 'Исправленный комментарий'
+        comment.save()
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'Исправленный комментарий')
+        etag = response['ETag']
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name = 'Сергей'
+        author.save()
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_etag_depends_on_viewer(self):
+        reader = Client()
+        reader.force_login(User.objects.create_user(username='Reader'))
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertNotEqual(self.client.get(url)['ETag'],
+                                    reader.get(url)['ETag'])
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Sergei')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(slug='test-group', title='Группа')
+        cls.post = Post.objects.create(text='Текст', author=cls.author,
+                                       group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.detail = reverse('posts:post_detail',
+                              kwargs={'post_id': self.post.pk})
+        self.profile = reverse('posts:profile',
+                               kwargs={'username': 'Sergei'})
+
+    def test_anonymous_hit_costs_no_queries(self):
+        urls = (reverse('posts:index'),
+                reverse('posts:group_list', kwargs={'slug': 'test-group'}),
+                self.profile, self.detail)
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response.content, first.content)
+
+    def test_key_ignores_unknown_params_only(self):
+        index = reverse('posts:index')
+        self.client.get(index)
+        with self.assertNumQueries(0):
+            self.client.get(index, {'utm_source': 'mail'})
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(index, {'page': 2})
+        self.assertTrue(captured.captured_queries)
+
+    def test_writes_purge_affected_pages(self):
+        self.client.get(self.detail)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Новый комментарий')
+        self.assertContains(self.client.get(self.detail),
+                            'Новый комментарий')
+        self.client.get(self.profile)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertContains(self.client.get(self.profile), 'Подписчиков: 1')
+        index = reverse('posts:index')
+        self.client.get(index)
+        Post.objects.create(text='Свежий пост', author=self.reader)
+        self.assertContains(self.client.get(index), 'Свежий пост')
+
+    def test_logged_in_users_bypass_cache(self):
+        self.client.get(self.detail)
+        self.client.force_login(self.reader)
+        response = self.client.get(self.detail)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+
+@override_settings(MEDIA_ACCEL=None, MEDIA_PRIVATE_DIRS=(TEMP_LOCK_DIR,),
+                   **MEDIA_SETTINGS)
+class MediaServingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in ('posts/photo.gif', 'cache/thumb.gif', 'cache/locks/a'):
+            path = os.path.join(TEMP_MEDIA_ROOT, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(b'0123456789')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get(self, path, **headers):
+        return self.client.get(f'/media/{path}', **headers)
+
+    def test_file_is_served_with_validators(self):
+        response = self.get('posts/photo.gif')
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        response = self.get('posts/photo.gif',
+                            HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_thumbnails_are_immutable(self):
+        response = self.get('cache/thumb.gif')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_range_requests(self):
+        response = self.get('posts/photo.gif', HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, HTTPStatus.PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        response = self.get('posts/photo.gif', HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        response = self.get('posts/photo.gif', HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code,
+                         HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+        response = self.get('posts/photo.gif', HTTP_RANGE='bytes=2-4',
+                            HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    @override_settings(MEDIA_ACCEL='x-accel')
+    def test_front_server_handoff(self):
+        response = self.get('posts/photo.gif')
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/posts/photo.gif')
+        self.assertEqual(response.content, b'')
+
+    def test_missing_and_private_files_are_not_found(self):
+        for path in ('posts/none.gif', '../manage.py', 'posts/',
+                     'cache/locks/a'):
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path).status_code,
+                                 HTTPStatus.NOT_FOUND)
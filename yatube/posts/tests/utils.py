@@ -0,0 +1,20 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+@contextmanager
+def run_on_commit(using=DEFAULT_DB_ALIAS):
+    """
+    Выполняет колбэки transaction.on_commit, накопленные в блоке.
+
+    TestCase не коммитит транзакцию теста, и без этого они не
+    запустятся (как captureOnCommitCallbacks(execute=True) в Django 3.2).
+    """
+    connection = connections[using]
+    start = len(connection.run_on_commit)
+    yield
+    # Колбэк может добавить новые - выполняем, пока очередь не опустеет.
+    while len(connection.run_on_commit) > start:
+        _, callback = connection.run_on_commit.pop(start)
+        callback()
@@ -1,26 +1,48 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition, require_GET
 
-from .forms import PostForm, CommentForm
+from .forms import PostForm, CommentForm, SearchForm
 from .models import Group, Post, User, Follow
-from posts.services.services import get_paginator
-
-
+from posts.services import counts, feeds, resize, tags, thumbnails
+from posts.services.comments import comment_batch
+from posts.services.page_cache import anonymous_page
+from posts.services.conditional import (detail_post, group_etag, index_etag,
+                                        post_etag, profile_author,
+                                        profile_etag)
+from posts.services.stats import stats_for
+from posts.services.querysets import feed_queryset
+from posts.services.search import SEARCH_KEYS, PostSearch
+from posts.services.services import CursorPaginator, get_paginator, page_key
+
+
+@anonymous_page(lambda: (tags.INDEX,))
+@condition(etag_func=index_etag)
 def index(request):
     template = 'posts/index.html'
-    posts = Post.objects.all()
-    page_obj = get_paginator(request, posts)
+    posts = feed_queryset()
+    page_obj = get_paginator(request, posts, counts.index_key())
+    thumbnails.prefetch(page_obj)
     context = {
         'page_obj': page_obj,
+        'cache_timeout': settings.INDEX_CACHE_TIMEOUT,
+        'index_tags': [tags.INDEX],
+        'page_key': page_key(request),
     }
     return render(request, template, context)
 
 
+@anonymous_page(lambda slug: (tags.group_tag(slug),))
+@condition(etag_func=group_etag)
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = get_paginator(request, posts)
+    posts = feed_queryset(group.posts.all())
+    page_obj = get_paginator(request, posts, counts.group_key(group.pk))
+    thumbnails.prefetch(page_obj)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -29,26 +51,61 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@anonymous_page(lambda username: (tags.author_tag(username),))
+@condition(etag_func=profile_etag)
 def profile(request, username):
     template = 'posts/profile.html'
-    post_user_list = Post.objects.select_related(
-        'author', 'group'
-    ).filter(author__username=username)
-    author = get_object_or_404(User, username=username)
+    author = profile_author(request, username)
+    if author is None:
+        raise Http404
+    post_user_list = feed_queryset(author.posts.all())
     following = (request.user.is_authenticated
                  and author.following.filter(user=request.user).exists())
-    number_of_posts = post_user_list.count()
-    page_obj = get_paginator(request, post_user_list)
+    stats = stats_for(author)
+    page_obj = get_paginator(request, post_user_list,
+                             total=stats.posts_count)
+    thumbnails.prefetch(page_obj)
     context = {
         'page_obj': page_obj,
         'username': author,
-        'number_of_posts': number_of_posts,
+        'stats': stats,
+        'number_of_posts': stats.posts_count,
         'post_user_list': post_user_list,
         'following': following
     }
     return render(request, template, context)
 
 
+def search(request):
+    """Полнотекстовый поиск по постам, лучшие совпадения сверху."""
+    template = 'posts/search.html'
+    form = SearchForm(request.GET or None)
+    page_obj = None
+    if form.is_valid():
+        data = form.cleaned_data
+        group = author = None
+        if data['group']:
+            group = Group.objects.filter(slug=data['group']).first()
+        if data['author']:
+            author = User.objects.filter(username=data['author']).first()
+        results = PostSearch(data['q'], group, author)
+        # Неизвестные группа или автор - пустой результат, а не фильтр.
+        if (group or not data['group']) and (author or not data['author']):
+            paginator = CursorPaginator(results, settings.PAGES_NUMBER,
+                                        keys=SEARCH_KEYS)
+            page_obj = paginator.get_page(after=request.GET.get('after'),
+                                          before=request.GET.get('before'))
+    query = request.GET.copy()
+    for name in ('after', 'before', 'page'):
+        query.pop(name, None)
+    context = {
+        'form': form,
+        'page_obj': page_obj,
+        'extra_query': query.urlencode()
+    }
+    return render(request, template, context)
+
+
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
@@ -61,21 +118,63 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@anonymous_page(lambda post_id: (tags.post_tag(post_id),))
+@condition(etag_func=post_etag)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post_det = get_object_or_404(Post, id=post_id)
-    post_count = Post.objects.filter(author__username=post_det.author).count()
-    comments = post_det.comments.all()
+    post_det = detail_post(request, post_id)
+    if post_det is None:
+        raise Http404
+    post_count = stats_for(post_det.author).posts_count
+    comments, next_cursor = comment_batch(post_det)
     form = CommentForm(request.POST or None)
     context = {
         'post': post_det,
         'post_count': post_count,
         'form': form,
-        'comments': comments
+        'comments': comments,
+        'next_cursor': next_cursor
     }
     return render(request, template, context)
 
 
+def post_comments(request, post_id):
+    """Следующая порция комментариев HTML-фрагментом для «Показать ещё»."""
+    template = 'posts/includes/comment_list.html'
+    post = get_object_or_404(Post.objects.only('pk'), id=post_id)
+    comments, next_cursor = comment_batch(post, request.GET.get('after'))
+    context = {
+        'post': post,
+        'comments': comments,
+        'next_cursor': next_cursor
+    }
+    return render(request, template, context)
+
+
+@require_GET
+def resized_image(request, preset, width, signature, name):
+    """
+    Вариант картинки поста нужной ширины для srcset.
+
+    Параметры подписаны, так что ширины ограничены реестром пресетов.
+    Формат выбирается по Accept (WebP, если клиент его понимает),
+    а уменьшается каждый вариант один раз - дальше он читается с диска.
+    """
+    if not resize.allowed(name, preset, width, signature):
+        raise Http404
+    image_format = resize.negotiate(request.META.get('HTTP_ACCEPT', ''), name)
+    variant = resize.variant(name, preset, width, image_format)
+    if variant is None:
+        raise Http404
+    response = FileResponse(
+        variant.storage.open(variant.name),
+        content_type=resize.CONTENT_TYPES[image_format])
+    patch_vary_headers(response, ('Accept',))
+    patch_cache_control(response, public=True,
+                        max_age=settings.RESIZE_MAX_AGE)
+    return response
+
+
 @login_required
 def post_create(request):
     form = PostForm(request.POST or None,
@@ -84,6 +183,7 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.schedule(post.image.name)
         return redirect('posts:profile', username=post.author)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -97,7 +197,9 @@ def post_edit(request, post_id):
                     files=request.FILES or None,
                     instance=post)
     if form.is_valid():
-        form.save()
+        post = form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post.image.name)
         return redirect('posts:post_detail', post_id=post.id)
     return render(request, 'posts/create_post.html',
                   {'form': form,
@@ -108,11 +210,12 @@ def post_edit(request, post_id):
 @login_required
 def follow_index(request):
     template = 'posts/follow.html'
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = get_paginator(request, posts)
+    feed = feeds.FollowFeed(request.user)
+    page_obj = get_paginator(request, feed)
+    thumbnails.prefetch(page_obj)
     context = {
         'page_obj': page_obj,
-        'posts': posts
+        'feed_stats': feed.stats
     }
     return render(request, template, context)
 
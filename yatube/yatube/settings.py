@@ -14,9 +14,14 @@ SECRET_KEY = 'lelk5vo0e!098gnjf2@z_cslxtf%w08fwb&7hv^zg4sy+=+5v-'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Один кэш на все процессы хоста: файл SQLite в режиме WAL. Тесты
+# работают с LocMemCache (yatube.settings_test)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.environ.get(
+            'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
     }
 }
 
@@ -26,6 +31,65 @@ ALLOWED_HOSTS = ['127.0.0.1', 'localhost', '[::1]', 'testserver',
                  'sergei2022.pythonanywhere.com',]
 
 PAGES_NUMBER = 10
+# Комментарии под постом подгружаются порциями по курсору
+COMMENTS_NUMBER = 20
+# Лента листается по токенам ?after=/?before= вместо ?page=N
+PAGINATION_CURSOR = True
+# Сколько номеров страниц показывать по обе стороны от текущей
+PAGINATION_WINDOW = 3
+# Счётчики постов в лентах живут в кэше и сдвигаются сигналами
+POSTS_COUNT_TIMEOUT = 60 * 60 * 24
+# Для всей таблицы постов брать оценку из статистики СУБД (после ANALYZE)
+POSTS_COUNT_ESTIMATE = False
+POSTS_COUNT_ESTIMATE_MIN = 100000
+# Списки админки без фильтров от этого размера показывают оценку числа строк
+ADMIN_COUNT_ESTIMATE_MIN = 100000
+# Посты авторов с числом подписчиков больше порога не раздаются по лентам
+# подписчиков, а подтягиваются при чтении ленты
+FEED_PULL_THRESHOLD = 10000
+FEED_PULL_TIMEOUT = 60 * 5
+# Фрагмент главной версионируется, поэтому TTL может быть долгим
+INDEX_CACHE_TIMEOUT = 60 * 60 * 24
+# Бюджет SQL-запросов на страницу по имени URL; превышение - предупреждение
+# в логе, а с QUERY_BUDGET_RAISE (в тестах) - ошибка
+QUERY_BUDGETS = {
+    'posts:index': 8,
+    'posts:group_list': 8,
+    'posts:profile': 10,
+    'posts:post_detail': 10,
+    'posts:post_comments': 4,
+    'posts:search': 6,
+    'posts:resized_image': 2,
+    'posts:follow_index': 10,
+}
+QUERY_BUDGET_RAISE = False
+# Страницы лент и постов для анонимов кэшируются целиком, секунд;
+# 0 - выключено. Записи сбрасывают их сразу по тегам (posts.services.tags)
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+# Защита от лавины пересборок (posts.services.tags.fetch): сколько ещё
+# отдавать устаревшую запись, пока её пересобирает один воркер; срок
+# блокировки пересборки и сколько ждать её результата; коэффициент
+# вероятностного раннего истечения (XFetch)
+CACHE_STALE_TTL = 60 * 10
+CACHE_LOCK_TIMEOUT = 30
+CACHE_LOCK_WAIT = 3
+CACHE_XFETCH_BETA = 1.0
+
+# Метрики запросов пишутся в консоль по JSON-строке на запрос
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
 # Application definition
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
@@ -45,6 +109,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,6 +140,44 @@ TEMPLATES = [
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Медиа отдаёт core.views.serve_media. 'x-accel' (nginx, internal location
+# MEDIA_ACCEL_PREFIX) или 'x-sendfile' (Apache, lighttpd) передают файл
+# фронт-серверу; None - отдаёт сам Django
+MEDIA_ACCEL = os.environ.get('MEDIA_ACCEL') or None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_MAX_AGE = 60 * 60
+# Имена файлов здесь зависят от содержимого и параметров (кэш sorl)
+MEDIA_IMMUTABLE_PREFIXES = ('cache/',)
+MEDIA_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Единый реестр размеров миниатюр: шаблоны ссылаются на них по имени.
+# widths - ширины вариантов для srcset, их отдаёт posts:resized_image
+THUMBNAIL_PRESETS = {
+    'card': {
+        'geometry': '960x339',
+        'crop': 'center',
+        'upscale': True,
+        'widths': (320, 640, 960, 1440),
+        'sizes': '(max-width: 1000px) 100vw, 960px',
+    },
+}
+# Сколько браузер может хранить вариант картинки, секунд
+RESIZE_MAX_AGE = 60 * 60 * 24 * 30
+# Миниатюры создаются при сохранении поста в пуле процессов; с
+# THUMBNAIL_SYNC (в тестах) - сразу, в том же процессе
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_SYNC = False
+THUMBNAIL_LOCK_DIR = os.path.join(MEDIA_ROOT, 'cache', 'locks')
+THUMBNAIL_LOCK_SLOTS = 64
+# Как часто страницы могут заново ставить в очередь картинку, миниатюру
+# которой не удалось создать, секунд
+THUMBNAIL_RETRY_DELAY = 60 * 10
+MEDIA_PRIVATE_DIRS = (THUMBNAIL_LOCK_DIR,)
+# Загрузки больше лимита пикселей отклоняются, остальные ужимаются
+# до мастер-копии с длинной стороной IMAGE_MASTER_SIZE
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_MASTER_SIZE = 2048
+IMAGE_MASTER_QUALITY = 85
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
@@ -0,0 +1,13 @@
+"""Настройки тестов: manage.py test и pytest (см. pytest.ini)."""
+import copy
+
+from .settings import *  # noqa: F401,F403
+from .settings import LOGGING
+
+# Прогоны не делят состояние кэша ни между собой, ни с сайтом.
+CACHES = {'default': {'BACKEND': 'core.cache.LocMemCache'}}
+QUERY_BUDGET_RAISE = True
+THUMBNAIL_SYNC = True
+
+LOGGING = copy.deepcopy(LOGGING)
+LOGGING['loggers']['core.middleware']['level'] = 'ERROR'